@@ -1,11 +1,29 @@
+import hashlib
 import json
 import logging
 import os
+import threading
 import time
+import weakref
 import packaging.version
 import random
+import shutil
 
 import base64
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import datetime
+import functools
+import heapq
+import io
+import queue
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 try:
     from urlparse import urlunparse
@@ -14,12 +32,13 @@ except ImportError:
 
 import boto3
 import boto3.exceptions
-import botocore.waiter
+import boto3.s3.transfer
 import botocore.exceptions
 from boto3.session import Session
 from botocore.errorfactory import ClientError
-from botocore.exceptions import EndpointConnectionError
+from s3transfer.utils import ReadFileChunk
 
+import dtoolcore
 from dtoolcore.utils import (
     generate_identifier,
     get_config_value,
@@ -45,6 +64,8 @@ _STRUCTURE_PARAMETERS = {
     "overlays_key_infix": "overlays",
     "annotations_key_infix": "annotations",
     "tags_key_infix": "tags",
+    "handle_index_key_infix": "handle_index",
+    "staging_key_infix": "staging",
     "structure_key_suffix": "structure.json",
     "dtool_readme_key_suffix": "README.txt",
     "dataset_readme_key_suffix": "README.yml",
@@ -89,9 +110,134 @@ Structural metadata describing the data items: $UUID/manifest.json
 Per item descriptive metadata prefixed by: $UUID/overlays/
 Dataset key/value pairs metadata prefixed by: $UUID/annotations/
 Dataset tags metadata: $UUID/tags/
+Index of item handles of a proto dataset prefixed by: $UUID/handle_index/
+Per item metadata added to a proto dataset prefixed by: $UUID/fragments/
+Batches of per item metadata prefixed by: $UUID/fragments/batches/
+Items being uploaded while their checksum is computed prefixed by:
+$UUID/staging/
 """
 
 
+#: Default number of threads used for concurrent metadata requests.
+_DEFAULT_MAX_WORKERS = 16
+
+#: Default cap of the total size of the files uploaded at the same time by
+#: put_items.
+_DEFAULT_MAX_BYTES_IN_FLIGHT = 1024 * 1024 * 1024
+
+# Settings of the managed transfers, see boto3.s3.transfer.TransferConfig,
+# that can be configured per bucket using DTOOL_S3_<SUFFIX>_<bucket>.
+_TRANSFER_SETTINGS = (
+    ("multipart_threshold", "MULTIPART_THRESHOLD"),
+    ("multipart_chunksize", "MULTIPART_CHUNKSIZE"),
+    ("max_concurrency", "MAX_CONCURRENCY"),
+    ("max_io_queue", "MAX_IO_QUEUE"),
+)
+
+# S3 limits multipart uploads to 10000 parts.
+_MAX_MULTIPART_PARTS = 10000
+_MIB = 1024 * 1024
+
+# Size of the blocks in which files are read to compute their checksums.
+_HASH_BLOCK_SIZE = _MIB
+
+# Files uploaded while their checksum is computed are only read into memory
+# up to this size, whatever the multipart threshold.
+_HASHING_MAX_BYTES_IN_MEMORY = 8 * _MIB
+
+# Defaults of the blocks read by the file objects returned by open_item: the
+# size of a block, the number of blocks kept in memory and the number of
+# blocks read ahead when the item is read sequentially.
+_OPEN_ITEM_BLOCK_SIZE = 8 * _MIB
+_OPEN_ITEM_CACHE_BLOCKS = 16
+_OPEN_ITEM_READ_AHEAD = 2
+
+# Directory below DTOOL_CACHE_DIRECTORY with the journals of the items put
+# into proto datasets, one JSON lines file per dataset UUID.
+_JOURNAL_DIRECTORY_NAME = "dtool-s3-journals"
+
+# Directory below DTOOL_CACHE_DIRECTORY with the state of the multipart
+# uploads of items, one subdirectory per dataset UUID.
+_UPLOADS_DIRECTORY_NAME = "dtool-s3-uploads"
+
+# Name of the index, in the cache directory of a dataset, of the names of the
+# cached files of the items. Item file names never start with a dot.
+_CACHE_INDEX_NAME = ".dtool-s3-index"
+
+# Lock files serialising the downloads of an item across processes are kept
+# in this directory of the dataset cache directory.
+_CACHE_LOCKS_DIRECTORY_NAME = ".locks"
+
+# When the cached items exceed DTOOL_S3_CACHE_MAX_BYTES the least recently
+# used ones are evicted until they take up this fraction of it. The cache is
+# scanned at most once per interval, in seconds, unless the bytes downloaded
+# since the last scan exceed the budget.
+_CACHE_LOW_WATERMARK = 0.9
+_CACHE_SCAN_INTERVAL = 60
+
+# The optional bucket level dataset catalog is sharded over sixteen objects
+# stored under this prefix at the top level of the bucket. The shard of a
+# dataset is given by the first character of the sha1 hexdigest of its UUID.
+_CATALOG_KEY_PREFIX = "dtool-catalog/"
+_CATALOG_SHARDS = "0123456789abcdef"
+
+# Number of attempts to update a catalog shard when racing other writers.
+_CATALOG_MAX_ATTEMPTS = 10
+
+# Number of handles buffered by put_item before they are written to a new
+# shard of the handle index.
+_HANDLE_INDEX_BATCH_SIZE = 1000
+
+# If buffering of item metadata is enabled, add_item_metadata collects the
+# metadata and writes it in batches below this infix of the fragments prefix.
+# The buffer is flushed when it holds metadata for this many items, or when
+# metadata is added and the oldest buffered metadata is older than this many
+# seconds.
+_ITEM_METADATA_BATCH_INFIX = "batches/"
+_ITEM_METADATA_BUFFER_SIZE = 1000
+_ITEM_METADATA_BUFFER_SECONDS = 60
+
+# Maximum number of keys that can be deleted using a single DeleteObjects
+# request, and number of attempts to delete keys that are throttled.
+_DELETE_BATCH_SIZE = 1000
+_DELETE_MAX_ATTEMPTS = 5
+
+# Error codes of requests that are worth retrying.
+_RETRYABLE_ERROR_CODES = (
+    "InternalError",
+    "RequestTimeout",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "500",
+    "503",
+)
+
+# Interval in seconds between the HEAD requests of _object_exists when
+# waiting for an object to appear, and lifetime in seconds and maximum number
+# of the records of missing keys kept by storage brokers.
+_OBJECT_EXISTS_POLL_INTERVAL = 0.5
+_MISSING_KEY_CACHE_SECONDS = 10
+_MISSING_KEY_CACHE_SIZE = 1024
+
+# Budget, in seconds spent sleeping between attempts, of the retries of an
+# upload and the bounds of the exponential backoff between attempts.
+_PUT_ITEM_MAX_RETRY_TIME = 90
+_PUT_ITEM_BASE_DELAY = 1
+_PUT_ITEM_MAX_DELAY = 20
+
+# Metadata of a data item as returned by a single HEAD request, or as recorded
+# by put_item when uploading the item. The handle is stored as found in the
+# object metadata, i.e. base64 encoded for datasets created using
+# dtool-s3>=0.14.0.
+_ItemHead = collections.namedtuple(
+    "_ItemHead",
+    ["size_in_bytes", "last_modified", "checksum", "handle"]
+)
+
+
 # Helper functions
 
 def _unicode_to_base64(unicode_str):
@@ -122,99 +268,1512 @@ def _base64_to_unicode(base64_str):
     return bs2us
 
 
-def _object_exists(s3resource, bucket, dest_path):
-    """Return object from bucket."""
+def _get_max_workers(bucket_name, config_path=None):
+    """Return number of threads to use for concurrent requests to bucket."""
+    return int(get_config_value(
+        "DTOOL_S3_MAX_WORKERS_{}".format(bucket_name),
+        config_path=config_path,
+        default=_DEFAULT_MAX_WORKERS
+    ))
+
 
+def _get_transfer_settings(bucket_name, config_path=None):
+    """Return TransferConfig keyword arguments configured for bucket."""
+    settings = {}
+    for name, suffix in _TRANSFER_SETTINGS:
+        value = get_config_value(
+            "DTOOL_S3_{}_{}".format(suffix, bucket_name),
+            config_path=config_path
+        )
+        if value is not None:
+            settings[name] = int(value)
+    return settings
+
+
+def _transfer_config(settings, size_in_bytes=None):
+    """Return TransferConfig for transferring an object.
+
+    If the object would need more than 10000 parts its part size is
+    increased to the next whole number of MiB that avoids this.
+
+    :param settings: TransferConfig keyword arguments
+    :param size_in_bytes: size of the object, if known
+    """
+    config = boto3.s3.transfer.TransferConfig(**settings)
+    if size_in_bytes is not None:
+        min_chunksize = -(-size_in_bytes // _MAX_MULTIPART_PARTS)
+        if config.multipart_chunksize < min_chunksize:
+            config.multipart_chunksize = -(-min_chunksize // _MIB) * _MIB
+    return config
+
+
+def _get_client_config_options(bucket_name, config_path=None):
+    """Return botocore client Config keyword arguments configured for bucket.
+
+    The connection pool holds at least as many connections as there are
+    threads issuing concurrent metadata requests or transferring parts.
+    """
+    def value(suffix):
+        return get_config_value(
+            "DTOOL_S3_{}_{}".format(suffix, bucket_name),
+            config_path=config_path
+        )
+
+    transfer_config = _transfer_config(
+        _get_transfer_settings(bucket_name, config_path))
+    options = {
+        "max_pool_connections": max(
+            10,
+            _get_max_workers(bucket_name, config_path),
+            transfer_config.max_concurrency
+        )
+    }
+    if value("MAX_POOL_CONNECTIONS") is not None:
+        options["max_pool_connections"] = int(value("MAX_POOL_CONNECTIONS"))
+    if value("CONNECT_TIMEOUT") is not None:
+        options["connect_timeout"] = float(value("CONNECT_TIMEOUT"))
+    if value("READ_TIMEOUT") is not None:
+        options["read_timeout"] = float(value("READ_TIMEOUT"))
+    if value("TCP_KEEPALIVE") is not None:
+        options["tcp_keepalive"] = _get_config_flag(
+            "DTOOL_S3_TCP_KEEPALIVE_{}".format(bucket_name),
+            config_path=config_path
+        )
+
+    retries = {}
+    if value("RETRY_MODE") is not None:
+        retries["mode"] = value("RETRY_MODE")
+    if value("MAX_ATTEMPTS") is not None:
+        retries["max_attempts"] = int(value("MAX_ATTEMPTS"))
+    if len(retries) > 0:
+        options["retries"] = retries
+
+    return options
+
+
+def _ordered_map(func, iterable, max_workers):
+    """Yield func(item) for each item in iterable, computed concurrently.
+
+    Results are yielded in the order of the input. Only a bounded number of
+    items are submitted ahead of the result being yielded, so the iterable
+    is consumed lazily and results stream back as soon as they are ready.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def _iter_objects(s3client, bucket, prefix):
+    """Yield the listing entries of all keys starting with prefix."""
+    paginator = s3client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            yield obj
+
+
+def _object_exists(s3client, bucket, key, timeout=0):
+    """Return True if the object exists, using a single HEAD request.
+
+    For reading after writing a positive timeout polls the object, every
+    half second, until it exists or timeout seconds have passed.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            s3client.head_object(Bucket=bucket, Key=key)
+        except ClientError:
+            if time.monotonic() + _OBJECT_EXISTS_POLL_INTERVAL > deadline:
+                return False
+            time.sleep(_OBJECT_EXISTS_POLL_INTERVAL)
+        else:
+            return True
+
+
+def _read_journal(fpath):
+    """Return dictionary of the journal entries in fpath, keyed by relpath.
+
+    Later entries take precedence. A line left incomplete by a process that
+    died while writing it is ignored.
+    """
+    journal = {}
     try:
-        obj = s3resource.Object(bucket, dest_path)
-        obj.wait_until_exists(WaiterConfig={'Delay': 5, 'MaxAttempts': 20})
-    except botocore.waiter.WaiterError:
+        with open(fpath, "r") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                journal[entry["relpath"]] = entry
+    except (IOError, OSError):
+        pass
+    return journal
+
+
+def _read_cache_index(fpath, offset=0):
+    """Read the cache index in fpath from offset onwards.
+
+    Each line of the index is a JSON list of an identifier and the name of
+    its cached file. Lines that are still being written are left for the
+    next read.
+
+    :returns: tuple of dictionary of the file names keyed by identifier, and
+              the offset to continue reading from
+    """
+    cache_index = {}
+    try:
+        with open(fpath, "rb") as fh:
+            fh.seek(offset)
+            data = fh.read()
+    except (IOError, OSError):
+        return cache_index, offset
+
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        try:
+            identifier, fname = json.loads(line.decode("utf-8"))
+        except (ValueError, TypeError):
+            continue
+        cache_index[identifier] = fname
+    return cache_index, offset + end
+
+
+def _iter_cached_files(cache_abspath):
+    """Yield (abspath, size_in_bytes, mtime) of the cached items.
+
+    Only the files listed in the cache indexes of the datasets, i.e. items
+    cached by dtool-s3, are considered.
+    """
+    try:
+        names = os.listdir(cache_abspath)
+    except OSError:
+        return
+    for name in names:
+        dataset_cache_abspath = os.path.join(cache_abspath, name)
+        cache_index, _ = _read_cache_index(
+            os.path.join(dataset_cache_abspath, _CACHE_INDEX_NAME))
+        for fname in set(cache_index.values()):
+            abspath = os.path.join(dataset_cache_abspath, fname)
+            try:
+                stat = os.stat(abspath)
+            except OSError:
+                continue
+            yield abspath, stat.st_size, stat.st_mtime
+
+
+@contextlib.contextmanager
+def _exclusive_file_lock(abspath):
+    """Hold an exclusive lock on the file at abspath, creating it if needed.
+
+    The lock file may be removed by :func:`_remove_lock_file` while waiting
+    for the lock, in which case the lock is taken on the new file.
+    Without fcntl the lock only serves as a marker and does not block.
+    """
+    while True:
+        fd = os.open(abspath, os.O_RDWR | os.O_CREAT, 0o666)
+        if fcntl is None:
+            break
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.stat(abspath).st_ino == os.fstat(fd).st_ino:
+                break
+        except OSError:
+            pass
+        os.close(fd)
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+def _remove_lock_file(abspath):
+    """Remove lock file, unless it is locked."""
+    try:
+        fd = os.open(abspath, os.O_RDWR)
+    except OSError:
+        return
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return
+        try:
+            os.remove(abspath)
+        except OSError:
+            pass
+    finally:
+        os.close(fd)
+
+
+def _evict_cached_file(abspath):
+    """Remove cached item unless it is pinned, return True if removed.
+
+    Processes pin items by holding a shared lock on them, the item is only
+    removed if an exclusive lock can be taken.
+    """
+    try:
+        fd = os.open(abspath, os.O_RDONLY)
+    except OSError:
         return False
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return False
+        try:
+            os.remove(abspath)
+        except OSError:
+            return False
+    finally:
+        os.close(fd)
+
+    # The lock file serialising the downloads of the item.
+    dataset_cache_abspath, fname = os.path.split(abspath)
+    _remove_lock_file(os.path.join(
+        dataset_cache_abspath,
+        _CACHE_LOCKS_DIRECTORY_NAME,
+        fname.split(".", 1)[0]
+    ))
     return True
 
 
-def _upload_file(s3client, fpath, bucket, dest_path, extra_args):
-    """Upload file to S3 bucket."""
+def _evict_cache(cache_abspath, max_bytes, keep=()):
+    """Evict least recently used items if the cache exceeds max_bytes.
+
+    :param keep: absolute paths of items that must not be evicted
+    :returns: size in bytes of the cached items
+    """
+    cached_files = sorted(
+        _iter_cached_files(cache_abspath),
+        key=lambda f: f[2]
+    )
+    size_in_bytes = sum(f[1] for f in cached_files)
+    if size_in_bytes <= max_bytes:
+        return size_in_bytes
+
+    target = max_bytes * _CACHE_LOW_WATERMARK
+    for abspath, file_size, _ in cached_files:
+        if size_in_bytes <= target:
+            break
+        if abspath in keep:
+            continue
+        if _evict_cached_file(abspath):
+            logger.debug("Evicted {} from cache".format(abspath))
+            size_in_bytes -= file_size
+    return size_in_bytes
+
+
+def _get_config_flag(key, config_path=None):
+    """Return True if the configuration value is set to a true value."""
+    value = get_config_value(key, config_path=config_path, default=False)
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _catalog_shard_key(uuid):
+    """Return key of the catalog shard holding the record of the dataset."""
+    return _CATALOG_KEY_PREFIX + generate_identifier(uuid)[0] + ".json"
+
+
+def _read_catalog_shard(s3client, bucket, key):
+    """Return (records, etag) of a catalog shard.
+
+    The records are a dictionary keyed by dataset UUID. The etag is None
+    if the shard does not exist yet.
+    """
+    try:
+        response = s3client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return {}, None
+        raise
+    content = json.loads(response["Body"].read().decode("utf-8"))
+    return content["datasets"], response["ETag"]
+
+
+def _write_catalog_shard(s3client, bucket, key, records, **kwargs):
+    s3client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps({"datasets": records}, separators=(",", ":")),
+        ContentType="application/json",
+        **kwargs
+    )
+
+
+def _update_catalog_shard(s3client, bucket, key, update):
+    """Apply update function to the records of a catalog shard.
+
+    The shards are created by :meth:`S3StorageBroker.rebuild_catalog`; if
+    the shard does not exist the bucket has no catalog and nothing is done.
+
+    Concurrent writers are serialised using conditional writes: the shard is
+    only replaced if it has not changed since it was read. Writers that lose
+    the race re-read the shard and re-apply their update. Should an update
+    still fail after _CATALOG_MAX_ATTEMPTS attempts a warning is logged and
+    False is returned; the catalog can then be regenerated using
+    :meth:`S3StorageBroker.rebuild_catalog`.
+    """
+    for attempt in range(_CATALOG_MAX_ATTEMPTS):
+        records, etag = _read_catalog_shard(s3client, bucket, key)
+        if etag is None:
+            logger.debug("No catalog shard {}, skipping update".format(key))
+            return False
+        update(records)
+        try:
+            _write_catalog_shard(
+                s3client, bucket, key, records, IfMatch=etag)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                raise
+            logger.debug("Lost race updating catalog shard {}".format(key))
+            time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+    logger.warning(
+        "Failed to update catalog shard {} after {} attempts".format(
+            key, _CATALOG_MAX_ATTEMPTS)
+    )
+    return False
+
+
+def _read_catalog(s3client, bucket, max_workers):
+    """Return dictionary of all catalog records keyed by dataset UUID.
+
+    Returns None if the bucket does not have a catalog.
+    """
+    shard_keys = [_CATALOG_KEY_PREFIX + c + ".json" for c in _CATALOG_SHARDS]
+
+    catalog = {}
+    found = False
+    for records, etag in _ordered_map(
+        lambda key: _read_catalog_shard(s3client, bucket, key),
+        shard_keys,
+        max_workers
+    ):
+        if etag is not None:
+            found = True
+        catalog.update(records)
+
+    if not found:
+        return None
+    return catalog
+
+
+def _delete_batch(s3client, bucket, keys):
+    """Delete a batch of keys using a single DeleteObjects request.
+
+    Keys that could not be deleted because the request was throttled are
+    retried with exponential backoff.
+
+    :returns: list of error dictionaries, with Key, Code and Message, of the
+              keys that could not be deleted
+    """
+    errors = []
+    for attempt in range(_DELETE_MAX_ATTEMPTS):
+        if attempt > 0:
+            time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+
+        try:
+            response = s3client.delete_objects(
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys],
+                    "Quiet": True,
+                }
+            )
+            batch_errors = response.get("Errors", [])
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in _RETRYABLE_ERROR_CODES:
+                raise
+            batch_errors = [
+                {"Key": key, "Code": code, "Message": str(e)} for key in keys
+            ]
+
+        throttled = []
+        for error in batch_errors:
+            if error.get("Code") in _RETRYABLE_ERROR_CODES:
+                throttled.append(error)
+            else:
+                errors.append(error)
+
+        if len(throttled) == 0:
+            return errors
+
+        keys = [error["Key"] for error in throttled]
+
+    errors.extend(throttled)
+    return errors
+
+
+def _bulk_delete(s3client, bucket, keys, max_workers):
+    """Delete keys from bucket.
+
+    The keys are consumed lazily and grouped into DeleteObjects batches of
+    up to 1000 keys, of which up to ``max_workers`` are in flight at any one
+    time. Listing and deleting therefore overlap and the memory use does not
+    depend on the number of keys.
+
+    :param keys: iterable of keys
+    :returns: list of error dictionaries, with Key, Code and Message, of the
+              keys that could not be deleted
+    """
+
+    def batches():
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) == _DELETE_BATCH_SIZE:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    errors = []
+    for batch_errors in _ordered_map(
+        lambda batch: _delete_batch(s3client, bucket, batch),
+        batches(),
+        max_workers
+    ):
+        errors.extend(batch_errors)
+
+    for error in errors:
+        logger.warning("Failed to delete {}: {} {}".format(
+            error["Key"], error.get("Code"), error.get("Message")))
+
+    return errors
+
+
+def _write_item_metadata_batches(
+    s3client,
+    bucket,
+    batch_key_prefix,
+    buffer,
+    lock
+):
+    """Write buffered item metadata to batch objects and empty the buffer.
+
+    The buffer is a dictionary mapping item identifiers to dictionaries of
+    item metadata. The items are sharded over up to sixteen batch objects by
+    the first character of their identifier. Batch objects are named by the
+    time they were written, see :func:`_item_metadata_batch_time`.
+    """
+    with lock:
+        entries = dict(buffer)
+        buffer.clear()
+    if len(entries) == 0:
+        return
+
+    shards = collections.defaultdict(dict)
+    for identifier, metadata in entries.items():
+        shards[identifier[0]][identifier] = metadata
+
+    batch_id = "{:020d}-{}".format(time.time_ns(), os.urandom(4).hex())
+    for shard in sorted(shards.keys()):
+        try:
+            s3client.put_object(
+                Bucket=bucket,
+                Key=batch_key_prefix + shard + "-" + batch_id + ".json",
+                Body=json.dumps(shards[shard], separators=(",", ":"))
+            )
+        except Exception:
+            # Put the metadata that has not been written back into the
+            # buffer, without overwriting anything added in the meantime.
+            with lock:
+                for records in shards.values():
+                    for identifier, metadata in records.items():
+                        buffered = buffer.setdefault(identifier, {})
+                        for key, value in metadata.items():
+                            buffered.setdefault(key, value)
+            raise
+        del shards[shard]
+
+
+def _item_metadata_batch_time(key):
+    """Return time in seconds since the epoch a batch object was written."""
+    name = key.rsplit("/", 1)[-1]
+    return int(name.split("-")[1]) / 1e9
+
+
+def _merge_item_metadata(item_metadata, identifier, metadata, written_at):
+    """Merge metadata of an item written at the given time.
+
+    The item_metadata dictionary maps identifiers to dictionaries of
+    (written_at, value) tuples keyed by metadata key, of which the value
+    written last is kept, whether it was written as a fragment or in a
+    batch.
+    """
+    current = item_metadata.setdefault(identifier, {})
+    for key, value in metadata.items():
+        if key not in current or current[key][0] <= written_at:
+            current[key] = (written_at, value)
+
+
+def _write_handle_index_shard(s3client, bucket, key_prefix, buffer, lock):
+    """Write buffered item handles to a new shard and empty the buffer.
+
+    The buffer is a dictionary mapping item identifiers to handles. Each
+    shard is uniquely named so that storage brokers putting items into the
+    same dataset do not overwrite each other's shards.
+    """
+    with lock:
+        entries = dict(buffer)
+        buffer.clear()
+    if len(entries) == 0:
+        return
+
+    key = key_prefix + "{:020d}-{}.json".format(
+        time.time_ns(),
+        os.urandom(4).hex()
+    )
+    try:
+        s3client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=json.dumps(entries, separators=(",", ":"))
+        )
+    except ClientError as e:
+        # The index is only an optimisation, items missing from it are
+        # discovered by iter_item_handles anyway.
+        logger.warning("Failed to write handle index: {}".format(e))
+
+
+def _flush_handle_index_at_exit(*args):
+    try:
+        _write_handle_index_shard(*args)
+    except Exception as e:
+        logger.error("Failed to write handle index: {}".format(e))
+
+
+def _flush_item_metadata_at_exit(*args):
+    try:
+        _write_item_metadata_batches(*args)
+    except Exception as e:
+        logger.error("Failed to write buffered item metadata: {}".format(e))
+
+
+def _is_retryable_error(error):
+    """Return True if a request that failed with error is worth retrying.
+
+    Connection problems, throttling and server side errors are worth
+    retrying; other errors, e.g. missing permissions or buckets, are fatal.
+    The client error wrapped by a :class:`S3UploadFailedError` is inspected,
+    wrapped errors that cannot be inspected are assumed to be transient.
+    """
+    while error is not None:
+        if isinstance(error, (botocore.exceptions.ConnectionError,
+                              botocore.exceptions.HTTPClientError,
+                              botocore.exceptions.IncompleteReadError)):
+            return True
+        if isinstance(error, ClientError):
+            code = error.response.get("Error", {}).get("Code")
+            status = error.response.get(
+                "ResponseMetadata", {}).get("HTTPStatusCode", 0)
+            # NoSuchUpload means that the multipart upload was aborted, the
+            # upload can be started again.
+            return code in _RETRYABLE_ERROR_CODES \
+                or code == "NoSuchUpload" \
+                or status >= 500
+        if not isinstance(error, boto3.exceptions.S3UploadFailedError):
+            return False
+        if error.__cause__ is None and error.__context__ is None:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _upload_file(s3client, fpath, bucket, dest_path, extra_args, config=None):
+    """Upload file to S3 bucket.
+
+    :returns: True if the upload succeeded, False if it failed with an
+              error worth retrying
+    :raises: errors that are not worth retrying
+    """
 
     try:
         s3client.upload_file(
             fpath,
             bucket,
             dest_path,
-            ExtraArgs=extra_args
+            ExtraArgs=extra_args,
+            Config=config
         )
 
-    except (s3client.exceptions.NoSuchUpload,
-            boto3.exceptions.S3UploadFailedError,
-            EndpointConnectionError) as e:
+    except (ClientError,
+            botocore.exceptions.BotoCoreError,
+            boto3.exceptions.S3UploadFailedError) as e:
+        if not _is_retryable_error(e):
+            raise
         logger.debug("Upload failed with: " + str(e))
         return False
 
     return True
 
 
-def _put_item_with_retry(
+class _ByteBudget(object):
+    """Cap of the number of bytes being transferred at the same time.
+
+    A transfer larger than the cap is let through once nothing else is in
+    flight, so that it does not block forever.
+    """
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, num_bytes):
+        with self._condition:
+            while self._in_flight > 0 and \
+                    self._in_flight + num_bytes > self._max_bytes:
+                self._condition.wait()
+            self._in_flight += num_bytes
+
+    def release(self, num_bytes):
+        with self._condition:
+            self._in_flight -= num_bytes
+            self._condition.notify_all()
+
+
+class _ItemPrefetch(object):
+    """Items being downloaded into the cache, see
+    :meth:`S3StorageBroker.prefetch_items`.
+
+    Iterating yields (identifier, abspath or exception) tuples in order of
+    completion, one for each item. The results are kept, so that iterating
+    again yields the same results, in the same order, before any further
+    ones.
+
+    If the cache has a budget, the total size of the items downloaded but
+    not yet yielded is capped at the budget, so that prefetched items are
+    not evicted by the items prefetched after them before they are read.
+    """
+
+    def __init__(
+        self,
+        storage_broker,
+        identifiers,
+        max_workers,
+        max_bytes_in_flight
+    ):
+        self._storage_broker = storage_broker
+        self._budget = _ByteBudget(max_bytes_in_flight)
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+
+        # Sizes of the items downloaded but not yet yielded, keyed by
+        # identifier, and the cap of their total size.
+        self._unread = {}
+        self._unread_budget = None
+        if storage_broker._cache_max_bytes is not None:
+            self._unread_budget = _ByteBudget(storage_broker._cache_max_bytes)
+
+        # Results taken from self._results so far, in order of completion.
+        self._completed = []
+        self._completed_lock = threading.Lock()
+
+        # Heap of (-priority, position, identifier) entries of the items not
+        # yet started. Reprioritised items get a new entry, the entries of
+        # self._queued identify the current one.
+        self._heap = []
+        self._queued = {}
+        for position, identifier in enumerate(
+                collections.OrderedDict.fromkeys(identifiers)):
+            entry = (0, position, identifier)
+            self._heap.append(entry)
+            self._queued[identifier] = entry
+        self._num_items = len(self._heap)
+        self._num_positions = self._num_items
+
+        # The worker threads are daemons, so that an abandoned prefetch does
+        # not keep the interpreter from exiting.
+        for _ in range(min(max_workers, self._num_items)):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def __iter__(self):
+        for i in range(self._num_items):
+            with self._completed_lock:
+                if i == len(self._completed):
+                    self._completed.append(self._results.get())
+                    self._release_unread(self._completed[i][0])
+                result = self._completed[i]
+            yield result
+
+    def _release_unread(self, identifier):
+        with self._lock:
+            size_in_bytes = self._unread.pop(identifier, None)
+        if size_in_bytes is not None:
+            self._unread_budget.release(size_in_bytes)
+
+    def set_priority(self, identifier, priority):
+        """Set priority of an item, items of higher priority start first.
+
+        Items have a priority of 0 initially and start in the order given.
+
+        :returns: False if the download of the item has already started
+        """
+        with self._lock:
+            if identifier not in self._queued:
+                return False
+            entry = (-priority, self._num_positions, identifier)
+            self._num_positions += 1
+            heapq.heappush(self._heap, entry)
+            self._queued[identifier] = entry
+        return True
+
+    def cancel(self):
+        """Cancel the downloads that have not started yet.
+
+        The results of the cancelled items are
+        :class:`concurrent.futures.CancelledError` exceptions.
+        """
+        with self._lock:
+            cancelled = list(self._queued)
+            self._queued.clear()
+            self._heap = []
+        for identifier in cancelled:
+            self._results.put(
+                (identifier, concurrent.futures.CancelledError()))
+
+    def _next_identifier(self):
+        with self._lock:
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                identifier = entry[2]
+                if self._queued.get(identifier) == entry:
+                    del self._queued[identifier]
+                    return identifier
+        return None
+
+    def _work(self):
+        while True:
+            identifier = self._next_identifier()
+            if identifier is None:
+                return
+            try:
+                self._results.put((identifier, self._prefetch(identifier)))
+            except Exception as e:
+                self._results.put((identifier, e))
+
+    def _prefetch(self, identifier):
+        storage_broker = self._storage_broker
+        if storage_broker._get_cached_item_fname(identifier) is not None:
+            return storage_broker.get_item_abspath(identifier)
+        size_in_bytes = storage_broker._get_item_head(identifier).size_in_bytes
+        if self._unread_budget is None:
+            return self._download(identifier, size_in_bytes)
+
+        self._unread_budget.acquire(size_in_bytes)
+        try:
+            abspath = self._download(identifier, size_in_bytes)
+        except Exception:
+            self._unread_budget.release(size_in_bytes)
+            raise
+        with self._lock:
+            self._unread[identifier] = size_in_bytes
+        return abspath
+
+    def _download(self, identifier, size_in_bytes):
+        self._budget.acquire(size_in_bytes)
+        try:
+            return self._storage_broker.get_item_abspath(identifier)
+        finally:
+            self._budget.release(size_in_bytes)
+
+
+class _ItemReader(io.RawIOBase):
+    """Seekable, read-only file object of an object, see
+    :meth:`S3StorageBroker.open_item`.
+
+    The object is read in blocks using ranged GET requests. The least
+    recently used blocks are dropped from memory when more than cache_blocks
+    are held. Reading the block after the one read last fetches up to
+    read_ahead further blocks in the same request.
+    """
+
+    def __init__(
+        self,
+        s3client,
+        bucket,
+        key,
+        size_in_bytes,
+        block_size,
+        cache_blocks,
+        read_ahead
+    ):
+        super(_ItemReader, self).__init__()
+        self._s3client = s3client
+        self._bucket = bucket
+        self._key = key
+        self._size_in_bytes = size_in_bytes
+        self._block_size = block_size
+        self._cache_blocks = max(cache_blocks, read_ahead + 1)
+        self._read_ahead = read_ahead
+        self._blocks = collections.OrderedDict()
+        self._last_block = None
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._checkClosed()
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size_in_bytes + offset
+        else:
+            raise ValueError("Invalid whence ({})".format(whence))
+        if position < 0:
+            raise ValueError("Negative seek position {}".format(position))
+        self._position = position
+        return position
+
+    def readinto(self, b):
+        self._checkClosed()
+        view = memoryview(b).cast("B")
+        num_bytes = 0
+        while num_bytes < len(view) and self._position < self._size_in_bytes:
+            index, offset = divmod(self._position, self._block_size)
+            block = self._get_block(index)
+            chunk = block[offset:offset + len(view) - num_bytes]
+            view[num_bytes:num_bytes + len(chunk)] = chunk
+            num_bytes += len(chunk)
+            self._position += len(chunk)
+        return num_bytes
+
+    def close(self):
+        self._blocks.clear()
+        super(_ItemReader, self).close()
+
+    def _get_block(self, index):
+        block = self._blocks.get(index)
+        if block is not None:
+            self._blocks.move_to_end(index)
+        else:
+            num_blocks = 1
+            if self._last_block is not None and index == self._last_block + 1:
+                while num_blocks <= self._read_ahead \
+                        and index + num_blocks not in self._blocks:
+                    num_blocks += 1
+            self._fetch_blocks(index, num_blocks)
+            block = self._blocks[index]
+        self._last_block = index
+        return block
+
+    def _fetch_blocks(self, index, num_blocks):
+        start = index * self._block_size
+        end = min(start + num_blocks * self._block_size, self._size_in_bytes)
+        response = self._s3client.get_object(
+            Bucket=self._bucket,
+            Key=self._key,
+            Range="bytes={}-{}".format(start, end - 1)
+        )
+        data = response["Body"].read()
+        for i in range(num_blocks):
+            block = data[i * self._block_size:(i + 1) * self._block_size]
+            if not block:
+                break
+            self._blocks[index + i] = block
+            self._blocks.move_to_end(index + i)
+        # Never drop the block being read.
+        self._blocks.move_to_end(index)
+        while len(self._blocks) > self._cache_blocks:
+            self._blocks.popitem(last=False)
+
+
+class _HashingReader(object):
+    """Read-only, non-seekable file wrapper that hashes the bytes read.
+
+    Not being seekable makes boto3 read the parts of a multipart upload in
+    order, so the bytes reach the hasher in the order of the file.
+    """
+
+    def __init__(self, fh, hasher):
+        self._fh = fh
+        self._hasher = hasher
+
+    def read(self, size=-1):
+        data = self._fh.read(size)
+        self._hasher.update(data)
+        return data
+
+
+def _upload_file_hashing(
     s3client,
-    s3resource,
     fpath,
     bucket,
     dest_path,
     extra_args,
-    max_retry_time=90,  # this is the maximum value that one iteration can run
-                        # for therefore the maximum amount the total function
-                        # can execute for is double this value
-    retry_seed=random.randint(1, 10),
-    retry_time_spent=0,
-    retry_attempts=0,
+    staging_path,
+    config=None,
 ):
-    """Robust putting of item into s3 bucket."""
-    success = _upload_file(s3client, fpath, bucket, dest_path, extra_args)
-
-    # If file upload did not succeed
-    if not success:
-        obj = _object_exists(s3resource, bucket, dest_path)  # NOQA
-
-        # If the object does not exist on the remote storage
-        if obj is None:
-
-            # If the time spent retrying doesn't exceed the maximum retry time
-            if retry_time_spent < max_retry_time:
-
-                # Calculate sleep time as the smaller of:
-                #  * the maximum retry value, or
-                #  * the larger of the following, to the power of 2:
-                #   * the random retry seed, or
-                #   * the retry time spent (initially zero)
-                sleep_time = min(
-                    max_retry_time,
-                    (max(retry_time_spent, retry_seed) ** 2)
-                )
+    """Upload file to S3 bucket computing its MD5 checksum on the way.
+
+    Files below the multipart threshold are uploaded with a single request.
+    Those of up to 8 MiB are read into memory once, larger ones are hashed
+    in blocks and then streamed from disk. Files above the threshold are
+    only read once: they are streamed to ``staging_path`` using a multipart
+    upload that hashes the parts as they are read. The staging object is
+    then copied server side to ``dest_path`` with the checksum added to its
+    metadata and deleted.
+
+    The checksum is stored in ``extra_args['Metadata']['checksum']``.
 
-                time.sleep(sleep_time)
-
-                retry_time_spent += sleep_time
-                retry_attempts += 1
-
-                _put_item_with_retry(
-                    s3client=s3client,
-                    s3resource=s3resource,
-                    fpath=fpath,
-                    bucket=bucket,
-                    dest_path=dest_path,
-                    extra_args=extra_args,
-                    max_retry_time=max_retry_time,
-                    retry_seed=retry_seed,
-                    retry_time_spent=retry_time_spent,
-                    retry_attempts=retry_attempts
+    :returns: True if the upload succeeded, False if it failed with an
+              error worth retrying
+    :raises: errors that are not worth retrying
+    """
+    if config is None:
+        config = boto3.s3.transfer.TransferConfig()
+    metadata = extra_args['Metadata']
+
+    size_in_bytes = os.path.getsize(fpath)
+    try:
+        if size_in_bytes < config.multipart_threshold:
+            with open(fpath, 'rb') as fh:
+                if size_in_bytes <= _HASHING_MAX_BYTES_IN_MEMORY:
+                    body = fh.read()
+                    digest = hashlib.md5(body)
+                else:
+                    body = fh
+                    digest = _md5(fh)
+                    fh.seek(0)
+                metadata['checksum'] = digest.hexdigest()
+                s3client.put_object(
+                    Bucket=bucket,
+                    Key=dest_path,
+                    Body=body,
+                    ContentMD5=base64.b64encode(
+                        digest.digest()).decode('ascii'),
+                    **extra_args
                 )
+        else:
+            # The size of a stream that cannot be seeked is determined by
+            # reading up to multipart_threshold bytes into memory; the file
+            # is known to be above the threshold, so read a single part.
+            stream_config = copy.copy(config)
+            stream_config.multipart_threshold = min(
+                config.multipart_threshold, config.multipart_chunksize)
+            hasher = hashlib.md5()
+            with open(fpath, 'rb') as fh:
+                s3client.upload_fileobj(
+                    _HashingReader(fh, hasher),
+                    bucket,
+                    staging_path,
+                    Config=stream_config
+                )
+            metadata['checksum'] = hasher.hexdigest()
+
+            copy_args = dict(extra_args)
+            copy_args['MetadataDirective'] = 'REPLACE'
+            s3client.copy(
+                {'Bucket': bucket, 'Key': staging_path},
+                bucket,
+                dest_path,
+                ExtraArgs=copy_args,
+                Config=config
+            )
+            s3client.delete_object(Bucket=bucket, Key=staging_path)
 
-            else:
+    except (ClientError,
+            botocore.exceptions.BotoCoreError,
+            boto3.exceptions.S3UploadFailedError) as e:
+        if not _is_retryable_error(e):
+            raise
+        logger.debug("Upload failed with: " + str(e))
+        return False
+
+    return True
+
+
+def _md5(fh):
+    """Return MD5 hash object of the rest of the file object.
+
+    The file object is read in blocks, so that large files are never held
+    in memory.
+    """
+    hasher = hashlib.md5()
+    for block in iter(functools.partial(fh.read, _HASH_BLOCK_SIZE), b""):
+        hasher.update(block)
+    return hasher
+
+
+def _read_upload_state(state_fpath):
+    """Return state of a resumable multipart upload, or None.
+
+    The state consists of the upload description stored in ``state_fpath``
+    and the part numbers and ETags of the uploaded parts, which are appended
+    to ``state_fpath + '.parts'`` as they complete.
+    """
+    try:
+        with open(state_fpath, "r") as fh:
+            state = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return None
+
+    state["parts"] = {}
+    try:
+        with open(state_fpath + ".parts", "r") as fh:
+            for line in fh:
+                words = line.split()
+                if len(words) == 2 and words[0].isdigit():
+                    state["parts"][int(words[0])] = words[1]
+    except (IOError, OSError):
+        pass
+    return state
+
+
+def _remove_upload_state(state_fpath):
+    for fpath in (state_fpath, state_fpath + ".parts"):
+        try:
+            os.remove(fpath)
+        except OSError:
+            pass
+
+
+def _start_resumable_upload(
+    s3client,
+    bucket,
+    dest_path,
+    extra_args,
+    state_fpath,
+    state,
+):
+    """Create multipart upload and write its state, return the state.
+
+    If the state cannot be written the upload goes ahead without it, it
+    just cannot be resumed.
+    """
+    response = s3client.create_multipart_upload(
+        Bucket=bucket,
+        Key=dest_path,
+        **extra_args
+    )
+    state = dict(state, upload_id=response["UploadId"])
+    _remove_upload_state(state_fpath)
+    tmp_state_fpath = state_fpath + ".tmp"
+    try:
+        mkdir_parents(os.path.dirname(state_fpath))
+        with open(tmp_state_fpath, "w") as fh:
+            json.dump(state, fh)
+        os.rename(tmp_state_fpath, state_fpath)
+    except (IOError, OSError) as e:
+        logger.warning(
+            "Failed to record state of upload of {}: {}".format(dest_path, e))
+    state["parts"] = {}
+    return state
+
+
+def _abort_resumable_upload(s3client, state, state_fpath):
+    """Abort multipart upload that cannot be completed and remove its state."""
+    if state is not None and "upload_id" in state:
+        try:
+            s3client.abort_multipart_upload(
+                Bucket=state["bucket"],
+                Key=state["key"],
+                UploadId=state["upload_id"]
+            )
+        except (ClientError, botocore.exceptions.BotoCoreError):
+            pass
+    _remove_upload_state(state_fpath)
+
+
+def _list_uploaded_parts(s3client, bucket, dest_path, state):
+    """Return dictionary of the part ETags of a multipart upload.
+
+    Only parts that are both listed by S3 and recorded in the state are
+    returned; parts whose upload was interrupted are uploaded again.
+
+    :raises ClientError: with code NoSuchUpload if the upload is gone
+    """
+    parts = {}
+    paginator = s3client.get_paginator("list_parts")
+    for page in paginator.paginate(
+        Bucket=bucket,
+        Key=dest_path,
+        UploadId=state["upload_id"]
+    ):
+        for part in page.get("Parts", []):
+            if state["parts"].get(part["PartNumber"]) == part["ETag"]:
+                parts[part["PartNumber"]] = part["ETag"]
+    return parts
+
+
+def _upload_file_resumable(
+    s3client,
+    fpath,
+    bucket,
+    dest_path,
+    extra_args,
+    state_fpath,
+    config=None,
+):
+    """Upload file to S3 bucket using a multipart upload that can be resumed.
+
+    The UploadId and the ETags of the uploaded parts are recorded in
+    ``state_fpath``. If the upload fails, in this or in another process, the
+    next call with the same state file lists the parts already uploaded and
+    only uploads the missing ones, provided that the file and its checksum
+    have not changed. If the state cannot be recorded the upload is kept in
+    memory only.
+
+    The multipart upload is left in place for resuming if it fails with an
+    error worth retrying, and aborted otherwise.
 
-                error = "Put with retry failed after {} attempts.".format(
-                    retry_attempts
+    :returns: True if the upload succeeded, False if it failed with an
+              error worth retrying
+    :raises: errors that are not worth retrying
+    """
+    if config is None:
+        config = boto3.s3.transfer.TransferConfig()
+
+    stat = os.stat(fpath)
+    expected = {
+        "bucket": bucket,
+        "key": dest_path,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "checksum": extra_args['Metadata'].get('checksum'),
+    }
+
+    state = None
+    try:
+        state = _read_upload_state(state_fpath)
+        parts = {}
+        if state is not None and all(
+            state.get(k) == v for k, v in expected.items()
+        ):
+            try:
+                parts = _list_uploaded_parts(
+                    s3client, bucket, dest_path, state)
+                logger.debug("Resuming upload of {} with {} parts".format(
+                    dest_path, len(parts)))
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "NoSuchUpload":
+                    raise
+                state = None
+        else:
+            _abort_resumable_upload(s3client, state, state_fpath)
+            state = None
+
+        if state is None:
+            expected["part_size"] = config.multipart_chunksize
+            state = _start_resumable_upload(
+                s3client, bucket, dest_path, extra_args, state_fpath, expected)
+
+        part_size = state["part_size"]
+        num_parts = max(1, -(-stat.st_size // part_size))
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        def upload_part(part_number):
+            # Do not upload any further parts once one has failed.
+            if failed.is_set():
+                return
+            try:
+                send_part(part_number)
+            except BaseException:
+                failed.set()
+                raise
+
+        def send_part(part_number):
+            # The part is hashed and then streamed from the file, rather
+            # than read into memory.
+            with ReadFileChunk.from_filename(
+                fpath,
+                (part_number - 1) * part_size,
+                part_size,
+                enable_callbacks=False
+            ) as body:
+                digest = _md5(body).digest()
+                body.seek(0)
+                response = s3client.upload_part(
+                    Bucket=bucket,
+                    Key=dest_path,
+                    UploadId=state["upload_id"],
+                    PartNumber=part_number,
+                    Body=body,
+                    ContentMD5=base64.b64encode(digest).decode("ascii")
                 )
-                logger.warning(error)
-                raise(S3StorageBrokerPutItemError(error))
+            etag = response["ETag"]
+            with lock:
+                parts[part_number] = etag
+                try:
+                    with open(state_fpath + ".parts", "a") as fh:
+                        fh.write("{} {}\n".format(part_number, etag))
+                except (IOError, OSError) as e:
+                    logger.warning(
+                        "Failed to record part of upload of {}: {}".format(
+                            dest_path, e))
+
+        missing = [n for n in range(1, num_parts + 1) if n not in parts]
+        with concurrent.futures.ThreadPoolExecutor(
+            config.max_concurrency
+        ) as executor:
+            futures = [executor.submit(upload_part, n) for n in missing]
+            done, not_done = concurrent.futures.wait(
+                futures,
+                return_when=concurrent.futures.FIRST_EXCEPTION
+            )
+            for future in not_done:
+                future.cancel()
+            for future in done:
+                future.result()
+
+        s3client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=dest_path,
+            UploadId=state["upload_id"],
+            MultipartUpload={"Parts": [
+                {"PartNumber": n, "ETag": parts[n]} for n in sorted(parts)
+            ]}
+        )
+
+    except (ClientError, botocore.exceptions.BotoCoreError) as e:
+        if isinstance(e, ClientError) \
+                and e.response["Error"]["Code"] == "NoSuchUpload":
+            _remove_upload_state(state_fpath)
+        elif not _is_retryable_error(e):
+            _abort_resumable_upload(s3client, state, state_fpath)
+        if not _is_retryable_error(e):
+            raise
+        logger.debug("Upload failed with: " + str(e))
+        return False
+    except Exception:
+        _abort_resumable_upload(s3client, state, state_fpath)
+        raise
+
+    _remove_upload_state(state_fpath)
+    return True
+
+
+def _copy_object(
+    s3client,
+    fpath,
+    bucket,
+    dest_path,
+    extra_args,
+    copy_source,
+    size_in_bytes,
+    config,
+):
+    """Copy object server side, replacing its metadata by extra_args.
+
+    Takes the arguments of :func:`_upload_file`, fpath is ignored. Objects
+    below the multipart threshold are copied using a single CopyObject
+    request, larger ones using concurrent UploadPartCopy requests.
+
+    :returns: True if the copy succeeded, False if it failed with an
+              error worth retrying
+    :raises: errors that are not worth retrying
+    """
+    copy_args = dict(extra_args)
+    copy_args['MetadataDirective'] = 'REPLACE'
+    try:
+        if size_in_bytes < config.multipart_threshold:
+            s3client.copy_object(
+                CopySource=copy_source,
+                Bucket=bucket,
+                Key=dest_path,
+                **copy_args
+            )
+        else:
+            s3client.copy(
+                copy_source,
+                bucket,
+                dest_path,
+                ExtraArgs=copy_args,
+                Config=config
+            )
+    except (ClientError, botocore.exceptions.BotoCoreError) as e:
+        if not _is_retryable_error(e):
+            raise
+        logger.debug("Copy failed with: " + str(e))
+        return False
+
+    return True
+
+
+def _download_file(s3client, bucket, key, fpath, config):
+    """Download object from S3 bucket to fpath."""
+    s3client.download_file(bucket, key, fpath, Config=config)
+
+
+def _upload_verified(s3client, bucket, dest_path, extra_args):
+    """Return True if the object with the checksum in extra_args exists.
+
+    Used after a failed upload, which may have completed even though its
+    response was lost.
+    """
+    checksum = extra_args['Metadata'].get('checksum')
+    if checksum is None:
+        return False
+    try:
+        response = s3client.head_object(Bucket=bucket, Key=dest_path)
+    except ClientError:
+        return False
+    return response['Metadata'].get('checksum') == checksum
+
+
+def _put_item_with_retry(
+    s3client,
+    fpath,
+    bucket,
+    dest_path,
+    extra_args,
+    max_retry_time=_PUT_ITEM_MAX_RETRY_TIME,
+    upload_func=None,
+):
+    """Robust putting of item into s3 bucket.
+
+    An upload that fails with an error worth retrying is retried after a
+    full jitter exponential backoff, unless a HEAD request shows that the
+    object made it into the bucket regardless. Errors that are not worth
+    retrying are raised straight away.
+
+    :param max_retry_time: maximum number of seconds spent sleeping between
+                           attempts
+    :param upload_func: function used instead of :func:`_upload_file`, called
+                        with the same arguments
+    :returns: dictionary with the number of ``attempts`` and the
+              ``retry_time`` in seconds spent sleeping between them
+    :raises S3StorageBrokerPutItemError: if the upload did not succeed
+                                         within the retry budget
+    """
+    if upload_func is None:
+        upload_func = _upload_file
+
+    stats = {"attempts": 0, "retry_time": 0.0}
+    while True:
+        stats["attempts"] += 1
+        if upload_func(s3client, fpath, bucket, dest_path, extra_args):
+            return stats
+
+        if _upload_verified(s3client, bucket, dest_path, extra_args):
+            logger.debug("Upload of {} failed but object exists".format(
+                dest_path))
+            return stats
+
+        backoff = min(
+            _PUT_ITEM_MAX_DELAY,
+            _PUT_ITEM_BASE_DELAY * 2 ** (stats["attempts"] - 1)
+        )
+        sleep_time = random.uniform(0, backoff)
+        if stats["retry_time"] + sleep_time > max_retry_time:
+            error = "Put with retry failed after {} attempts.".format(
+                stats["attempts"]
+            )
+            logger.warning(error)
+            raise S3StorageBrokerPutItemError(error)
+
+        time.sleep(sleep_time)
+        stats["retry_time"] += sleep_time
+
+
+# Process-wide pool of boto3 sessions and clients. Creating a client is
+# expensive (the service model has to be loaded and a new connection pool is
+# set up), so all storage brokers configured with the same endpoint,
+# credentials and client configuration share them. Clients are thread safe.
+# Resources are not, so each thread gets its own resource.
+_CLIENT_POOL = {}
+_CLIENT_POOL_LOCK = threading.Lock()
+_RESOURCE_POOL = threading.local()
+
+
+def _reset_client_pool():
+    """Drop all pooled sessions, clients and resources.
+
+    Called in forked child processes, which must not share the connection
+    pools of their parent.
+    """
+    global _CLIENT_POOL_LOCK, _RESOURCE_POOL
+    _CLIENT_POOL.clear()
+    _CLIENT_POOL_LOCK = threading.Lock()
+    _RESOURCE_POOL = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_client_pool)
+
+
+def _freeze_config_options(options):
+    """Return hashable representation of botocore client config options."""
+    return tuple(sorted(
+        (k, _freeze_config_options(v) if isinstance(v, dict) else v)
+        for k, v in options.items()
+    ))
+
+
+def _get_pooled_session(credentials):
+    """Return pooled boto3 session; the caller must hold _CLIENT_POOL_LOCK."""
+    _, access_key_id, secret_access_key = credentials
+    key = ("session", access_key_id, secret_access_key)
+    if key not in _CLIENT_POOL:
+        _CLIENT_POOL[key] = Session(
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key
+        )
+    return _CLIENT_POOL[key]
+
+
+def _get_pooled_client(credentials, config_options):
+    """Return S3 client shared by the whole process.
+
+    :param credentials: tuple of endpoint, access key id and secret access key
+    :param config_options: keyword arguments for botocore.client.Config
+    """
+    key = ("client", credentials, _freeze_config_options(config_options))
+    with _CLIENT_POOL_LOCK:
+        if key not in _CLIENT_POOL:
+            session = _get_pooled_session(credentials)
+            _CLIENT_POOL[key] = session.client(
+                's3',
+                endpoint_url=credentials[0],
+                config=botocore.client.Config(**config_options)
+            )
+        return _CLIENT_POOL[key]
+
+
+def _get_pooled_resource(credentials, config_options):
+    """Return S3 resource shared by all storage brokers in the calling thread.
+
+    :param credentials: tuple of endpoint, access key id and secret access key
+    :param config_options: keyword arguments for botocore.client.Config
+    """
+    key = (credentials, _freeze_config_options(config_options))
+    resources = getattr(_RESOURCE_POOL, "resources", None)
+    if resources is None:
+        resources = _RESOURCE_POOL.resources = {}
+    if key not in resources:
+        with _CLIENT_POOL_LOCK:
+            session = _get_pooled_session(credentials)
+            resources[key] = session.resource(
+                's3',
+                endpoint_url=credentials[0],
+                config=botocore.client.Config(**config_options)
+            )
+    return resources[key]
 
 
 class S3StorageBrokerPutItemError(RuntimeError):
@@ -242,39 +1801,176 @@ class S3StorageBroker(BaseStorageBroker):
 
         self.uuid = uuid
 
-        self.s3resource, self.s3client, self.unsigned_s3client = \
-            self._get_resource_and_client(self.bucket)
+        # The configuration is validated straight away, but the clients and
+        # the key prefixes, which require a request to the registration key,
+        # are only resolved on first use. Creating a storage broker therefore
+        # does not touch the network.
+        self._credentials = self._get_credentials(self.bucket)
 
-        self._structure_parameters = _STRUCTURE_PARAMETERS
+        self._structure_parameters = dict(_STRUCTURE_PARAMETERS)
         self.dataset_registration_key = 'dtool-{}'.format(self.uuid)
         self._structure_parameters["dataset_registration_key"] = self.dataset_registration_key  # NOQA
 
-        self.data_key_prefix = self._generate_key_prefix("data_key_infix")
-        self.fragments_key_prefix = self._generate_key_prefix(
-            "fragment_key_infix"
+        self._s3_cache_abspath = get_config_value(
+            "DTOOL_CACHE_DIRECTORY",
+            config_path=config_path,
+            default=DEFAULT_CACHE_PATH
+        )
+
+        self._max_workers = _get_max_workers(self.bucket, config_path)
+
+        # Handles of the items put by this storage broker that have not yet
+        # been written to the handle index, keyed by identifier.
+        self._handle_index_buffer = {}
+        self._handle_index_lock = threading.Lock()
+        self._handle_index_finalizer = None
+
+        # Item metadata read using HEAD requests, keyed by identifier.
+        self._item_head_cache = {}
+
+        # Settings of the managed uploads and downloads of items.
+        self._transfer_settings = _get_transfer_settings(
+            self.bucket,
+            config_path=config_path
         )
-        self.overlays_key_prefix = self._generate_key_prefix(
-            "overlays_key_infix"
+
+        # Connection pool, timeout and retry configuration of the clients.
+        self._client_config_options = _get_client_config_options(
+            self.bucket,
+            config_path=config_path
         )
-        self.annotations_key_prefix = self._generate_key_prefix(
-            "annotations_key_infix"
+
+        # Journal of the items put into the proto dataset, loaded on first
+        # use and keyed by relpath.
+        self._journal = None
+        self._journal_lock = threading.Lock()
+
+        # Budget of the item cache, the bytes downloaded since the cache was
+        # last scanned, and the items pinned by this storage broker.
+        cache_max_bytes = get_config_value(
+            "DTOOL_S3_CACHE_MAX_BYTES",
+            config_path=config_path
         )
-        self.tags_key_prefix = self._generate_key_prefix(
-            "tags_key_infix"
+        self._cache_max_bytes = None
+        if cache_max_bytes is not None:
+            self._cache_max_bytes = int(cache_max_bytes)
+        self._cache_bytes = 0
+        self._cache_scanned_at = None
+        self._cache_lock = threading.Lock()
+        self._pinned_items = {}
+
+        # Downloads in progress in this process, keyed by identifier.
+        self._downloads = {}
+        self._downloads_lock = threading.Lock()
+
+        # Names of the cached files of the items, keyed by identifier.
+        self._cache_index = {}
+        self._cache_index_offset = 0
+        self._cache_index_lock = threading.Lock()
+
+        # Expiry times of the records of keys found to be missing.
+        self._missing_keys = {}
+
+        # Number of items put, attempts made and seconds spent sleeping
+        # between the attempts.
+        self._put_item_stats = {"items": 0, "attempts": 0, "retry_time": 0.0}
+        self._put_item_stats_lock = threading.Lock()
+
+        # Compute the checksums of items while they are uploaded.
+        self._hash_while_upload = _get_config_flag(
+            "DTOOL_S3_HASH_WHILE_UPLOAD_{}".format(self.bucket),
+            config_path=config_path
         )
 
-        self.http_manifest_key = self._generate_key("http_manifest_key")
+        # Item metadata buffered by add_item_metadata, keyed by identifier.
+        self._buffer_item_metadata = _get_config_flag(
+            "DTOOL_S3_BUFFER_ITEM_METADATA_{}".format(self.bucket),
+            config_path=config_path
+        )
+        self._item_metadata_buffer = {}
+        self._item_metadata_buffer_lock = threading.Lock()
+        self._item_metadata_buffer_started = None
+        self._item_metadata_finalizer = None
+
+        # Properties and metadata of all items, keyed by identifier, while
+        # the dataset is being frozen.
+        self._item_properties_cache = None
+        self._item_metadata_cache = None
+
+    # Lazily resolved clients and key prefixes.
+
+    @property
+    def s3resource(self):
+        # Resources are not thread safe, the pool hands out one per thread.
+        return _get_pooled_resource(
+            self._credentials, self._client_config_options)
+
+    # The clients are looked up in the pool on every access, rather than
+    # kept by the storage broker, so that storage brokers created before a
+    # fork do not use the connection pool of the parent in the child.
+
+    @property
+    def s3client(self):
+        return _get_pooled_client(
+            self._credentials,
+            dict(self._client_config_options, signature_version="s3v4")
+        )
 
-        self._s3_cache_abspath = get_config_value(
-            "DTOOL_CACHE_DIRECTORY",
-            config_path=config_path,
-            default=DEFAULT_CACHE_PATH
+    @property
+    def unsigned_s3client(self):
+        return _get_pooled_client(
+            self._credentials,
+            dict(
+                self._client_config_options,
+                signature_version=botocore.UNSIGNED
+            )
         )
 
+    @property
+    def data_key_prefix(self):
+        return self._generate_key_prefix("data_key_infix")
+
+    @property
+    def fragments_key_prefix(self):
+        return self._generate_key_prefix("fragment_key_infix")
+
+    @property
+    def overlays_key_prefix(self):
+        return self._generate_key_prefix("overlays_key_infix")
+
+    @property
+    def annotations_key_prefix(self):
+        return self._generate_key_prefix("annotations_key_infix")
+
+    @property
+    def tags_key_prefix(self):
+        return self._generate_key_prefix("tags_key_infix")
+
+    @property
+    def item_metadata_batch_key_prefix(self):
+        return self.fragments_key_prefix + _ITEM_METADATA_BATCH_INFIX
+
+    @property
+    def handle_index_key_prefix(self):
+        return self._generate_key_prefix("handle_index_key_infix")
+
+    @property
+    def staging_key_prefix(self):
+        return self._generate_key_prefix("staging_key_infix")
+
+    @property
+    def http_manifest_key(self):
+        return self._generate_key("http_manifest_key")
+
     # Generic helper functions.
 
     @classmethod
-    def _get_resource_and_client(cls, bucket_name):
+    def _get_credentials(cls, bucket_name):
+        """Return (endpoint, access key id, secret access key) for bucket.
+
+        All three values are None if the bucket is not configured explicitly,
+        in which case the AWS configuration is used.
+        """
         # Get S3 endpoint, access key and secret key. Can be left
         # unconfigured, in which case the AWS configuration is used.
         s3_endpoint = get_config_value(
@@ -287,14 +1983,6 @@ class S3StorageBroker(BaseStorageBroker):
             "DTOOL_S3_SECRET_ACCESS_KEY_{}".format(bucket_name)
         )
 
-        unsigned_config = botocore.client.Config(
-            signature_version=botocore.UNSIGNED)
-
-        # Use signature version 4 for presigned URLs - required for cross-network
-        # access where URLs are generated in one network (e.g., container) but
-        # used from another (e.g., host machine)
-        signed_config = botocore.client.Config(signature_version='s3v4')
-
         if (
             s3_endpoint is not None
             or s3_access_key_id is not None
@@ -315,29 +2003,21 @@ class S3StorageBroker(BaseStorageBroker):
                     "DTOOL_S3_SECRET_ACCESS_KEY_{bucket}."
                     .format(bucket=bucket_name))
 
-            session = Session(
-                aws_access_key_id=s3_access_key_id,
-                aws_secret_access_key=s3_secret_access_key
-            )
+        return s3_endpoint, s3_access_key_id, s3_secret_access_key
 
-            s3resource = session.resource(
-                's3',
-                endpoint_url=s3_endpoint
-            )
-            s3client = session.client(
-                's3',
-                endpoint_url=s3_endpoint,
-                config=signed_config
-            )
-            unsigned_s3client = boto3.client(
-                's3',
-                endpoint_url=s3_endpoint,
-                config=unsigned_config
-            )
-        else:
-            s3resource = boto3.resource('s3')
-            s3client = boto3.client('s3', config=signed_config)
-            unsigned_s3client = boto3.client('s3', config=unsigned_config)
+    @classmethod
+    def _get_resource_and_client(cls, bucket_name, config_path=None):
+        credentials = cls._get_credentials(bucket_name)
+        options = _get_client_config_options(bucket_name, config_path)
+
+        # Use signature version 4 for presigned URLs - required for cross-network
+        # access where URLs are generated in one network (e.g., container) but
+        # used from another (e.g., host machine)
+        s3resource = _get_pooled_resource(credentials, options)
+        s3client = _get_pooled_client(
+            credentials, dict(options, signature_version="s3v4"))
+        unsigned_s3client = _get_pooled_client(
+            credentials, dict(options, signature_version=botocore.UNSIGNED))
 
         return s3resource, s3client, unsigned_s3client
 
@@ -347,14 +2027,52 @@ class S3StorageBroker(BaseStorageBroker):
         In cases of old datasets (prior to version 0.4.0) this information is
         not available on the dataset. In these cases this method returns None.
         """
-        sb_version = None
-        structure_key = self.get_structure_key()
-        if _object_exists(self.s3resource, self.bucket, structure_key):
-            structure_parameters_txt = self.get_text(structure_key)
-            structure_parameters = json.loads(structure_parameters_txt)
-            if "storage_broker_version" in structure_parameters:
-                sb_version = structure_parameters["storage_broker_version"]
-        return sb_version
+        if not hasattr(self, "_upload_storage_broker_version"):
+            sb_version = None
+            structure_key = self.get_structure_key()
+            if self.object_exists(structure_key):
+                structure_parameters_txt = self.get_text(structure_key)
+                structure_parameters = json.loads(structure_parameters_txt)
+                if "storage_broker_version" in structure_parameters:
+                    sb_version = structure_parameters["storage_broker_version"]
+            self._upload_storage_broker_version = sb_version
+        return self._upload_storage_broker_version
+
+    def object_exists(self, key, timeout=0):
+        """Return True if the object with key exists in the bucket.
+
+        A single HEAD request is made. Keys found missing are remembered for
+        a few seconds, so that probing them again makes no request, unless a
+        positive timeout is given. In that case the object is polled until
+        it exists or timeout seconds have passed, for reading after writing.
+
+        :param key: key of the object
+        :param timeout: maximum number of seconds to wait for the object
+        """
+        now = time.monotonic()
+        if timeout <= 0 and self._missing_keys.get(key, 0) > now:
+            return False
+
+        exists = _object_exists(self.s3client, self.bucket, key, timeout)
+        if exists:
+            self._forget_missing_key(key)
+        else:
+            self._remember_missing_key(key)
+        return exists
+
+    def _remember_missing_key(self, key):
+        now = time.monotonic()
+        if len(self._missing_keys) >= _MISSING_KEY_CACHE_SIZE:
+            for k, expiry in list(self._missing_keys.items()):
+                if expiry <= now:
+                    self._missing_keys.pop(k, None)
+            if len(self._missing_keys) >= _MISSING_KEY_CACHE_SIZE:
+                self._missing_keys.clear()
+        self._missing_keys[key] = now + _MISSING_KEY_CACHE_SECONDS
+
+    def _forget_missing_key(self, key):
+        """Forget that key was missing, as it has been written."""
+        self._missing_keys.pop(key, None)
 
     def _get_prefix(self):
         if not hasattr(self, '_prefix'):
@@ -387,33 +2105,154 @@ class S3StorageBroker(BaseStorageBroker):
     def _generate_key_prefix(self, structure_dict_key):
         return self._generate_key(structure_dict_key) + '/'
 
-    def _get_item_object(self, handle):
-        identifier = generate_identifier(handle)
-        item_key = self.data_key_prefix + identifier
-        obj = self.s3resource.Object(self.bucket, item_key)
-        return obj
+    def _get_item_head(self, identifier, with_last_modified=False):
+        """Return the :class:`_ItemHead` metadata of an item.
+
+        The size, timestamp, checksum and handle of an item are all read
+        using a single HEAD request, which is cached for the lifetime of the
+        storage broker. Items put by the storage broker are already in the
+        cache, without their last modified time, which is only requested if
+        with_last_modified is True.
+        """
+        item_head = self._item_head_cache.get(identifier)
+        if item_head is None or (
+            with_last_modified and item_head.last_modified is None
+        ):
+            response = self.s3client.head_object(
+                Bucket=self.bucket,
+                Key=self.data_key_prefix + identifier
+            )
+            item_head = _ItemHead(
+                size_in_bytes=response['ContentLength'],
+                last_modified=response['LastModified'],
+                checksum=response['Metadata'].get('checksum'),
+                handle=response['Metadata'].get('handle'),
+            )
+            self._item_head_cache[identifier] = item_head
+        return item_head
 
     # Class methods to override.
 
     @classmethod
     def list_dataset_uris(cls, base_uri, config_path):
-        """Return list containing URIs with base URI."""
-        uri_list = []
+        """Return list containing URIs with base URI.
+
+        If the dataset catalog is enabled for the bucket, and the bucket has
+        a catalog, the URIs are read from the catalog.
+        """
+        parse_result = generous_parse_uri(base_uri)
+        bucket_name = parse_result.netloc
+        if _get_config_flag(
+            "DTOOL_S3_CATALOG_{}".format(bucket_name),
+            config_path=config_path
+        ):
+            _, s3client, _ = cls._get_resource_and_client(
+                bucket_name, config_path)
+            catalog = _read_catalog(
+                s3client,
+                bucket_name,
+                _get_max_workers(bucket_name, config_path)
+            )
+            if catalog is not None:
+                return [
+                    cls.generate_uri(None, uuid, base_uri)
+                    for uuid in sorted(catalog.keys())
+                ]
+
+        return list(cls.iter_dataset_uris(base_uri, config_path))
+
+    @classmethod
+    def iter_dataset_uris(cls, base_uri, config_path=None):
+        """Yield URIs of the datasets with base URI, in registration key order.
+
+        The registration keys are probed concurrently. A registration key
+        that is empty means that the dataset is stored without a prefix, in
+        which case only a HEAD request of the administrative metadata is
+        needed to decide whether it is a dataset.
+        """
+        parse_result = generous_parse_uri(base_uri)
+        bucket_name = parse_result.netloc
+        _, s3client, _ = cls._get_resource_and_client(
+            bucket_name, config_path)
+
+        def probe(registration_obj):
+            uuid = registration_obj["Key"].split('-', 1)[1]
+            prefix = ''
+            if registration_obj["Size"] > 0:
+                try:
+                    response = s3client.get_object(
+                        Bucket=bucket_name,
+                        Key=registration_obj["Key"]
+                    )
+                except ClientError:
+                    return None
+                prefix = response['Body'].read().decode()
+            admin_metadata_key = prefix + uuid + '/' + \
+                _STRUCTURE_PARAMETERS["admin_metadata_key_suffix"]
+            if _object_exists(s3client, bucket_name, admin_metadata_key):
+                return cls.generate_uri(None, uuid, base_uri)
+            return None
+
+        def registration_objs():
+            # Registration keys never contain a slash, using it as delimiter
+            # skips the catalog and anything else stored below "dtool-".
+            paginator = s3client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(
+                Bucket=bucket_name,
+                Prefix='dtool-',
+                Delimiter='/'
+            ):
+                for registration_obj in page.get("Contents", []):
+                    yield registration_obj
+
+        max_workers = _get_max_workers(bucket_name, config_path)
+        for uri in _ordered_map(probe, registration_objs(), max_workers):
+            if uri is not None:
+                yield uri
+
+    @classmethod
+    def rebuild_catalog(cls, base_uri, config_path=None):
+        """Regenerate the dataset catalog of the bucket from a listing.
 
+        All catalog shards are overwritten, records of datasets that no
+        longer exist are dropped.
+
+        :returns: number of datasets in the catalog
+        """
         parse_result = generous_parse_uri(base_uri)
         bucket_name = parse_result.netloc
-        resource, _, _ = cls._get_resource_and_client(bucket_name)
-        bucket = resource.Bucket(bucket_name)
-
-        for obj in bucket.objects.filter(Prefix='dtool').all():
-            uuid = obj.key.split('-', 1)[1]
-            uri = cls.generate_uri(None, uuid, base_uri)
+        _, s3client, _ = cls._get_resource_and_client(
+            bucket_name, config_path)
+        max_workers = _get_max_workers(bucket_name, config_path)
 
+        def catalog_record(uri):
             storage_broker = cls(uri, config_path)
-            if storage_broker.has_admin_metadata():
-                uri_list.append(uri)
+            admin_metadata = storage_broker.get_admin_metadata()
+            size_in_bytes = None
+            if admin_metadata.get("type") == "dataset":
+                manifest = storage_broker.get_manifest()
+                size_in_bytes = sum(
+                    item["size_in_bytes"]
+                    for item in manifest["items"].values()
+                )
+            return storage_broker._catalog_record(
+                admin_metadata, size_in_bytes)
+
+        shards = dict((c, {}) for c in _CATALOG_SHARDS)
+        uris = cls.iter_dataset_uris(base_uri, config_path)
+        for record in _ordered_map(catalog_record, uris, max_workers):
+            shard_key = _catalog_shard_key(record["uuid"])
+            shards[shard_key[len(_CATALOG_KEY_PREFIX)]][record["uuid"]] = record  # NOQA
+
+        for c, records in shards.items():
+            _write_catalog_shard(
+                s3client,
+                bucket_name,
+                _CATALOG_KEY_PREFIX + c + ".json",
+                records
+            )
 
-        return uri_list
+        return sum(len(records) for records in shards.values())
 
     @classmethod
     def generate_uri(cls, name, uuid, base_uri):
@@ -429,15 +2268,20 @@ class S3StorageBroker(BaseStorageBroker):
     # Methods to override.
 
     def _create_structure(self):
+        prefix = '' if self.dataset_prefix is None else self.dataset_prefix
         self.s3resource.Object(self.bucket, self.dataset_registration_key).put(
-            Body='' if self.dataset_prefix is None else self.dataset_prefix
+            Body=prefix
         )
+        self._forget_missing_key(self.dataset_registration_key)
+        # No need to read back the registration key we have just written.
+        self._prefix = prefix
 
     def put_text(self, key, content):
         logger.debug("Put text {}".format(self))
         self.s3resource.Object(self.bucket, key).put(
             Body=content
         )
+        self._forget_missing_key(key)
 
     def get_text(self, key):
         logger.debug("Get text {}".format(self))
@@ -495,6 +2339,18 @@ class S3StorageBroker(BaseStorageBroker):
             Body=json.dumps(admin_metadata),
             Metadata=str_admin_metadata
         )
+        self._forget_missing_key(self.get_admin_metadata_key())
+
+        if self._catalog_enabled:
+            self.update_catalog(admin_metadata)
+
+    def put_manifest(self, manifest):
+        super(S3StorageBroker, self).put_manifest(manifest)
+
+        # Remember the size of the dataset for its catalog record.
+        self._size_in_bytes = sum(
+            item["size_in_bytes"] for item in manifest["items"].values()
+        )
 
     def get_admin_metadata(self):
         logger.debug("Get admin metdata {}".format(self))
@@ -524,13 +2380,14 @@ class S3StorageBroker(BaseStorageBroker):
 
     def get_size_in_bytes(self, handle):
         logger.debug("Get size in bytes {}".format(self))
-        obj = self._get_item_object(handle)
-        return int(obj.content_length)
+        item_head = self._get_item_head(generate_identifier(handle))
+        return int(item_head.size_in_bytes)
 
     def get_utc_timestamp(self, handle):
         logger.debug("Get utc timestamp {}".format(self))
-        obj = self._get_item_object(handle)
-        return time.mktime(obj.last_modified.timetuple())
+        item_head = self._get_item_head(
+            generate_identifier(handle), with_last_modified=True)
+        return time.mktime(item_head.last_modified.timetuple())
 
     def get_hash(self, handle):
         logger.debug("Get hash {}".format(self))
@@ -540,64 +2397,365 @@ class S3StorageBroker(BaseStorageBroker):
         # not the md5 sum of the uploaded object for items that are uploaded
         # using multipart uploads (large files).
         # See: https://stackoverflow.com/a/43067788
-        obj = self._get_item_object(handle)
-        return obj.get()['Metadata']['checksum']
+        item_head = self._get_item_head(generate_identifier(handle))
+        if item_head.checksum is None:
+            raise KeyError('checksum')
+        return item_head.checksum
 
 # According to the tests the below is not needed.
 #   def get_relpath(self, handle):
-#       obj = self._get_item_object(handle)
-#       return obj.get()['Metadata']['handle']
+#       item_head = self._get_item_head(generate_identifier(handle))
+#       return item_head.handle
 
     def has_admin_metadata(self):
         """Return True if the administrative metadata exists.
 
-        This is the definition of being a "dataset".
+        This is the definition of being a "dataset". The answer is never
+        taken from the records of missing keys, as the administrative
+        metadata is checked right after it is written, e.g. when a proto
+        dataset is renamed or frozen.
         """
         logger.debug("Has admin metadata {}".format(self))
 
-        try:
-            self.get_admin_metadata()
-            return True
-        except ClientError:
-            return False
+        return _object_exists(
+            self.s3client, self.bucket, self.get_admin_metadata_key())
 
     def get_item_abspath(self, identifier):
         """Return absolute path at which item content can be accessed.
 
+        Items that have already been downloaded are looked up in the cache
+        index of the dataset, without any requests.
+
         :param identifier: item identifier
         :returns: absolute path from which the item content can be accessed
         """
         logger.debug("Get item abspath {} {}".format(identifier, self))
 
-        if not hasattr(self, "_admin_metadata_cache"):
-            self._admin_metadata_cache = self.get_admin_metadata()
-        admin_metadata = self._admin_metadata_cache
+        local_item_abspath = self._get_cached_item_abspath(identifier)
+        if local_item_abspath is not None:
+            return local_item_abspath
+
+        # Threads asking for an item which is being downloaded wait for the
+        # download to finish, rather than downloading it again.
+        with self._downloads_lock:
+            future = self._downloads.get(identifier)
+            if future is not None:
+                in_flight = True
+            else:
+                in_flight = False
+                future = concurrent.futures.Future()
+                self._downloads[identifier] = future
+        if in_flight:
+            return future.result()
 
-        uuid = admin_metadata["uuid"]
-        # Create directory for the specific dataset.
-        dataset_cache_abspath = os.path.join(self._s3_cache_abspath, uuid)
-        mkdir_parents(dataset_cache_abspath)
+        try:
+            local_item_abspath = self._download_item(identifier)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(local_item_abspath)
+        finally:
+            with self._downloads_lock:
+                del self._downloads[identifier]
 
-        bucket_fpath = self.data_key_prefix + identifier
-        obj = self.s3resource.Object(self.bucket, bucket_fpath)
-        relpath = obj.get()['Metadata']['handle']
-        _, ext = os.path.splitext(relpath)
+        return local_item_abspath
 
+    def _get_cached_item_abspath(self, identifier):
+        """Return absolute path of the item in the cache, or None."""
+        fname = self._get_cached_item_fname(identifier)
+        if fname is None:
+            return None
         local_item_abspath = os.path.join(
-            dataset_cache_abspath,
-            identifier + ext
-        )
+            self._s3_cache_abspath, self.uuid, fname)
         if not os.path.isfile(local_item_abspath):
+            return None
+        if self._cache_max_bytes is not None:
+            # The modification time records when the item was last used,
+            # for evicting the least recently used items.
+            try:
+                os.utime(local_item_abspath)
+            except OSError:
+                pass
+        return local_item_abspath
 
-            tmp_local_item_abspath = local_item_abspath + ".tmp"
-            self.s3resource.Bucket(self.bucket).download_file(
-                bucket_fpath,
-                tmp_local_item_abspath
-            )
-            os.rename(tmp_local_item_abspath, local_item_abspath)
+    def _download_item(self, identifier):
+        """Download item into the cache, return absolute path of the item.
+
+        Processes sharing the cache take turns on a lock file per item, so
+        that only the first one downloads it and the others find it in the
+        cache index, without any requests. Each download goes to a temporary
+        file of its own, which is only renamed once complete.
+        """
+        dataset_cache_abspath = os.path.join(self._s3_cache_abspath, self.uuid)
+        locks_abspath = os.path.join(
+            dataset_cache_abspath, _CACHE_LOCKS_DIRECTORY_NAME)
+        mkdir_parents(locks_abspath)
+
+        lock_abspath = os.path.join(locks_abspath, identifier)
+        try:
+            with _exclusive_file_lock(lock_abspath):
+                local_item_abspath = self._get_cached_item_abspath(identifier)
+                if local_item_abspath is not None:
+                    return local_item_abspath
+
+                bucket_fpath = self.data_key_prefix + identifier
+                item_head = self._get_item_head(identifier)
+                _, ext = os.path.splitext(item_head.handle)
+
+                fname = identifier + ext
+                local_item_abspath = os.path.join(dataset_cache_abspath, fname)
+                downloaded = not os.path.isfile(local_item_abspath)
+                if downloaded:
+                    tmp_local_item_abspath = os.path.join(
+                        dataset_cache_abspath,
+                        ".{}.{}.{}.tmp".format(
+                            fname, os.getpid(), threading.get_ident())
+                    )
+                    try:
+                        _download_file(
+                            self.s3client,
+                            self.bucket,
+                            bucket_fpath,
+                            tmp_local_item_abspath,
+                            _transfer_config(
+                                self._transfer_settings,
+                                item_head.size_in_bytes
+                            )
+                        )
+                        os.rename(tmp_local_item_abspath, local_item_abspath)
+                    except BaseException:
+                        try:
+                            os.remove(tmp_local_item_abspath)
+                        except OSError:
+                            pass
+                        raise
+
+                # Processes waiting for the lock find the item in the index.
+                self._add_to_cache_index(identifier, fname)
+        finally:
+            # Once the item is in the cache the lock file is no longer
+            # needed; waiting processes take the lock on a new lock file.
+            _remove_lock_file(lock_abspath)
+
+        if downloaded:
+            self._enforce_cache_budget(
+                local_item_abspath, item_head.size_in_bytes)
 
         return local_item_abspath
 
+    def _enforce_cache_budget(self, abspath, size_in_bytes):
+        """Evict least recently used items if the cache exceeds its budget.
+
+        The cache is only scanned when the bytes added since the last scan
+        could have taken it over budget, or the last scan is more than a
+        minute ago, as other processes add to the cache as well.
+
+        :param abspath: absolute path of the item just added to the cache,
+                        which is never evicted
+        :param size_in_bytes: size of the item
+        """
+        if self._cache_max_bytes is None:
+            return
+        with self._cache_lock:
+            self._cache_bytes += size_in_bytes
+            now = time.monotonic()
+            if self._cache_scanned_at is not None \
+                    and now - self._cache_scanned_at < _CACHE_SCAN_INTERVAL \
+                    and self._cache_bytes <= self._cache_max_bytes:
+                return
+            keep = set(fpath for _, fpath, _ in self._pinned_items.values())
+            keep.add(abspath)
+            self._cache_bytes = _evict_cache(
+                self._s3_cache_abspath,
+                self._cache_max_bytes,
+                keep=keep
+            )
+            self._cache_scanned_at = now
+
+    def pin_item(self, identifier):
+        """Return absolute path of item, which is not evicted until unpinned.
+
+        Items are pinned by holding a shared lock on them, which is honoured
+        by all processes evicting items from the cache. Pinning an item
+        several times requires unpinning it as many times.
+
+        :param identifier: item identifier
+        :returns: absolute path from which the item content can be accessed
+        """
+        with self._cache_lock:
+            if identifier in self._pinned_items:
+                fd, abspath, count = self._pinned_items[identifier]
+                self._pinned_items[identifier] = (fd, abspath, count + 1)
+                return abspath
+
+        while True:
+            abspath = self.get_item_abspath(identifier)
+            try:
+                fd = os.open(abspath, os.O_RDONLY)
+            except OSError:
+                # Evicted in the meantime.
+                continue
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            if os.fstat(fd).st_nlink > 0:
+                break
+            os.close(fd)
+
+        with self._cache_lock:
+            if identifier in self._pinned_items:
+                os.close(fd)
+                fd, abspath, count = self._pinned_items[identifier]
+                self._pinned_items[identifier] = (fd, abspath, count + 1)
+            else:
+                self._pinned_items[identifier] = (fd, abspath, 1)
+        return abspath
+
+    def unpin_item(self, identifier):
+        """Allow item pinned using :meth:`pin_item` to be evicted again."""
+        with self._cache_lock:
+            fd, abspath, count = self._pinned_items.pop(identifier)
+            if count > 1:
+                self._pinned_items[identifier] = (fd, abspath, count - 1)
+                return
+        os.close(fd)
+
+    def prefetch_items(
+        self,
+        identifiers,
+        max_workers=None,
+        max_bytes_in_flight=None
+    ):
+        """Download items into the cache concurrently.
+
+        The items are downloaded as :meth:`get_item_abspath` would, which
+        includes keeping the cache within its budget. A failure to download
+        an item does not stop the other items from being downloaded, the
+        exception is yielded instead.
+
+        Iterating over the returned object yields (identifier, abspath or
+        exception) tuples in order of completion. Its ``set_priority``
+        method lets items jump the queue, its ``cancel`` method drops the
+        items not yet started.
+
+        If the cache has a budget, ``DTOOL_S3_CACHE_MAX_BYTES``, no more
+        than the budget is downloaded ahead of the items yielded, so that
+        the items are not evicted by later ones before they are yielded.
+        Pin the items, see :meth:`pin_item`, to keep them in the cache for
+        longer.
+
+        :param identifiers: iterable of item identifiers
+        :param max_workers: number of items downloaded at the same time,
+                            defaults to the ``DTOOL_S3_MAX_WORKERS_<bucket>``
+                            setting
+        :param max_bytes_in_flight: cap of the total size of the items
+                                    downloaded at the same time, defaults to
+                                    1 GiB
+        :returns: prefetch of the items, iterable of their results
+        """
+        logger.debug("Prefetch items {}".format(self))
+
+        if max_workers is None:
+            max_workers = self._max_workers
+        if max_bytes_in_flight is None:
+            max_bytes_in_flight = _DEFAULT_MAX_BYTES_IN_FLIGHT
+
+        # Resolve the dataset prefix once rather than in every worker.
+        self._get_prefix()
+
+        return _ItemPrefetch(
+            self,
+            identifiers,
+            max_workers,
+            max_bytes_in_flight
+        )
+
+    def open_item(
+        self,
+        identifier,
+        block_size=_OPEN_ITEM_BLOCK_SIZE,
+        cache_blocks=_OPEN_ITEM_CACHE_BLOCKS,
+        read_ahead=_OPEN_ITEM_READ_AHEAD
+    ):
+        """Return seekable, read-only binary file object of item content.
+
+        Only the parts of the item that are read are transferred, using
+        ranged GET requests of block_size bytes. Items already in the cache
+        are opened from the cache.
+
+        :param identifier: item identifier
+        :param block_size: size in bytes of the blocks read
+        :param cache_blocks: number of blocks kept in memory
+        :param read_ahead: number of blocks read ahead when the item is read
+                           sequentially
+        :returns: file object
+        """
+        logger.debug("Open item {} {}".format(identifier, self))
+
+        fname = self._get_cached_item_fname(identifier)
+        if fname is not None:
+            try:
+                return open(os.path.join(
+                    self._s3_cache_abspath, self.uuid, fname), "rb")
+            except (IOError, OSError):
+                pass
+
+        item_head = self._get_item_head(identifier)
+        return _ItemReader(
+            self.s3client,
+            self.bucket,
+            self.data_key_prefix + identifier,
+            item_head.size_in_bytes,
+            block_size,
+            cache_blocks,
+            read_ahead
+        )
+
+    @property
+    def _cache_index_abspath(self):
+        return os.path.join(
+            self._s3_cache_abspath,
+            self.uuid,
+            _CACHE_INDEX_NAME
+        )
+
+    def _get_cached_item_fname(self, identifier):
+        """Return name of the cached file of the item, or None.
+
+        The lines added to the cache index since it was last read are read
+        when the item is not known, as it may have been downloaded by another
+        process.
+        """
+        with self._cache_index_lock:
+            if identifier not in self._cache_index:
+                cache_index, self._cache_index_offset = _read_cache_index(
+                    self._cache_index_abspath,
+                    self._cache_index_offset
+                )
+                self._cache_index.update(cache_index)
+            return self._cache_index.get(identifier)
+
+    def _add_to_cache_index(self, identifier, fname):
+        """Append the name of the cached file of an item to the index."""
+        with self._cache_index_lock:
+            if self._cache_index.get(identifier) == fname:
+                return
+            self._cache_index[identifier] = fname
+            line = (json.dumps([identifier, fname]) + "\n").encode("utf-8")
+            try:
+                fd = os.open(
+                    self._cache_index_abspath,
+                    os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                    0o644
+                )
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logger.warning("Failed to write cache index {}: {}".format(
+                    self._cache_index_abspath, e))
+
     def list_overlay_names(self):
         """Return list of overlay names."""
         logger.debug("List overlay names {}".format(self))
@@ -651,37 +2809,350 @@ class S3StorageBroker(BaseStorageBroker):
     def put_item(self, fpath, relpath):
         logger.debug("Put item {}".format(self))
 
+        fname = generate_identifier(relpath)
+        dest_path = self.data_key_prefix + fname
+        stat = os.stat(fpath)
+        size_in_bytes = stat.st_size
+
+        if self._put_item_in_journal(fname, relpath, stat):
+            logger.debug("Skip put item {}, already uploaded".format(relpath))
+            self._add_to_handle_index(fname, relpath)
+            return relpath
+
+        # _unicode_to_base64 used to deal with relpaths that include non-ascii chars.  # NOQA
+        extra_args = {
+            'Metadata': {
+                'handle': _unicode_to_base64(relpath),
+            }
+        }
+
         # Here the MD5 checksum is calculated so that it can be uploaded with
         # the item as a piece of metadata. This is needed as the AWS etag is
         # not the md5 sum of the uploaded object for items that are uploaded
         # using multipart uploads (large files).
         # See: https://stackoverflow.com/a/43067788
-        checksum = S3StorageBroker.hasher(fpath)
+        config = _transfer_config(self._transfer_settings, size_in_bytes)
+        if self._hash_while_upload:
+            # The checksum is calculated while the file is uploaded.
+            upload_func = functools.partial(
+                _upload_file_hashing,
+                staging_path=self.staging_key_prefix + fname,
+                config=config
+            )
+        else:
+            extra_args['Metadata']['checksum'] = S3StorageBroker.hasher(fpath)
+            if size_in_bytes >= config.multipart_threshold:
+                # Large items are uploaded in parts that are recorded, so
+                # that a failed upload can be resumed.
+                upload_func = functools.partial(
+                    _upload_file_resumable,
+                    state_fpath=os.path.join(self._uploads_abspath, fname),
+                    config=config
+                )
+            else:
+                upload_func = functools.partial(_upload_file, config=config)
 
-        fname = generate_identifier(relpath)
-        dest_path = self.data_key_prefix + fname
+        stats = _put_item_with_retry(
+            s3client=self.s3client,
+            fpath=fpath,
+            bucket=self.bucket,
+            dest_path=dest_path,
+            extra_args=extra_args,
+            upload_func=upload_func
+        )
+        checksum = extra_args['Metadata'].get('checksum')
+        self._item_put(fname, relpath, size_in_bytes, checksum, stats)
+        self._add_to_journal(relpath, stat, checksum)
 
-        # _unicode_to_base64 used to deal with relpaths that include non-ascii chars.  # NOQA
+        return relpath
+
+    def _item_put(
+        self,
+        identifier,
+        relpath,
+        size_in_bytes,
+        checksum,
+        stats,
+    ):
+        """Record an item that has been put into the dataset."""
+        with self._put_item_stats_lock:
+            self._put_item_stats["items"] += 1
+            self._put_item_stats["attempts"] += stats["attempts"]
+            self._put_item_stats["retry_time"] += stats["retry_time"]
+
+        # Remember what has been uploaded so that the properties of the item
+        # do not have to be requested again when the dataset is frozen. The
+        # last modified time is set by S3, depending on retries, multipart
+        # uploads and copies, so it is only requested when needed.
+        self._item_head_cache[identifier] = _ItemHead(
+            size_in_bytes=size_in_bytes,
+            last_modified=None,
+            checksum=checksum,
+            handle=_unicode_to_base64(relpath),
+        )
+        self._forget_missing_key(self.data_key_prefix + identifier)
+        self._add_to_handle_index(identifier, relpath)
+
+    def copy_item(self, src_storage_broker, identifier, properties):
+        """Copy item of another S3 dataset into this one, server side.
+
+        The item is copied using CopyObject, or UploadPartCopy for items
+        above the multipart threshold, so its content does not pass through
+        this machine. Both storage brokers must use the same endpoint and
+        credentials.
+
+        :param src_storage_broker: :class:`S3StorageBroker` of the source
+        :param identifier: item identifier
+        :param properties: item properties as in the manifest of the source,
+                           the checksum is reused and the relpath is stored
+                           as a base64 encoded handle
+        :returns: relpath of the item
+        """
+        logger.debug("Copy item {} {}".format(identifier, self))
+
+        relpath = properties["relpath"]
+        size_in_bytes = properties["size_in_bytes"]
         extra_args = {
             'Metadata': {
                 'handle': _unicode_to_base64(relpath),
-                'checksum': checksum,
+                'checksum': properties["hash"],
             }
         }
-        _put_item_with_retry(
+        upload_func = functools.partial(
+            _copy_object,
+            copy_source={
+                'Bucket': src_storage_broker.bucket,
+                'Key': src_storage_broker.data_key_prefix + identifier,
+            },
+            size_in_bytes=size_in_bytes,
+            config=_transfer_config(self._transfer_settings, size_in_bytes)
+        )
+
+        stats = _put_item_with_retry(
             s3client=self.s3client,
-            s3resource=self.s3resource,
-            fpath=fpath,
+            fpath=None,
             bucket=self.bucket,
-            dest_path=dest_path,
-            extra_args=extra_args
+            dest_path=self.data_key_prefix + identifier,
+            extra_args=extra_args,
+            upload_func=upload_func
+        )
+        self._item_put(
+            identifier,
+            relpath,
+            size_in_bytes,
+            properties["hash"],
+            stats
         )
 
         return relpath
 
+    @property
+    def _uploads_abspath(self):
+        return os.path.join(
+            self._s3_cache_abspath,
+            _UPLOADS_DIRECTORY_NAME,
+            self.uuid
+        )
+
+    def abort_stale_multipart_uploads(self, max_age_seconds=24 * 60 * 60):
+        """Abort multipart uploads of items that have not been completed.
+
+        Parts of incomplete multipart uploads are stored, and charged for,
+        until the upload is completed or aborted. Uploads interrupted by a
+        crash are resumed by putting the item again; this method cleans up
+        those that never will be.
+
+        :param max_age_seconds: only abort uploads initiated longer ago
+        :returns: number of aborted uploads
+        """
+        logger.debug("Abort stale multipart uploads {}".format(self))
+
+        cutoff = datetime.datetime.now(datetime.timezone.utc) \
+            - datetime.timedelta(seconds=max_age_seconds)
+        num_aborted = 0
+        paginator = self.s3client.get_paginator("list_multipart_uploads")
+        for prefix in (self.data_key_prefix, self.staging_key_prefix):
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                for upload in page.get("Uploads", []):
+                    if upload["Initiated"] > cutoff:
+                        continue
+                    try:
+                        self.s3client.abort_multipart_upload(
+                            Bucket=self.bucket,
+                            Key=upload["Key"],
+                            UploadId=upload["UploadId"]
+                        )
+                    except ClientError as e:
+                        if e.response["Error"]["Code"] != "NoSuchUpload":
+                            raise
+                        continue
+                    num_aborted += 1
+                    _remove_upload_state(os.path.join(
+                        self._uploads_abspath,
+                        upload["Key"].rsplit("/", 1)[-1]
+                    ))
+        return num_aborted
+
+    @property
+    def _journal_abspath(self):
+        return os.path.join(
+            self._s3_cache_abspath,
+            _JOURNAL_DIRECTORY_NAME,
+            self.uuid + ".jsonl"
+        )
+
+    def _get_journal(self):
+        with self._journal_lock:
+            if self._journal is None:
+                self._journal = _read_journal(self._journal_abspath)
+            return self._journal
+
+    def _put_item_in_journal(self, identifier, relpath, stat):
+        """Return True if the file has already been put into the dataset.
+
+        This is the case if the journal has an entry for the relpath that
+        matches the size and modification time of the file, and the object in
+        the bucket has the checksum recorded in the journal.
+        """
+        entry = self._get_journal().get(relpath)
+        if entry is None:
+            return False
+        if entry["size"] != stat.st_size \
+                or entry["mtime_ns"] != stat.st_mtime_ns:
+            return False
+        try:
+            item_head = self._get_item_head(identifier)
+        except ClientError:
+            return False
+        return item_head.checksum == entry["md5"]
+
+    def _add_to_journal(self, relpath, stat, checksum):
+        """Append entry of a file that has been put to the journal.
+
+        Each entry is appended using a single write, so that an entry is
+        either complete or, if the process dies while writing it, ignored
+        when the journal is read.
+        """
+        entry = {
+            "relpath": relpath,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "md5": checksum,
+        }
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._journal_lock:
+            if self._journal is not None:
+                self._journal[relpath] = entry
+            try:
+                mkdir_parents(os.path.dirname(self._journal_abspath))
+                fd = os.open(
+                    self._journal_abspath,
+                    os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                    0o644
+                )
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logger.warning("Failed to write journal {}: {}".format(
+                    self._journal_abspath, e))
+
+    def get_put_item_stats(self):
+        """Return statistics of the uploads of the items put so far.
+
+        :returns: dictionary with the number of ``items`` put, the number of
+                  upload ``attempts`` and the ``retry_time`` in seconds spent
+                  sleeping between attempts
+        """
+        with self._put_item_stats_lock:
+            return dict(self._put_item_stats)
+
+    def put_items(self, items, max_workers=None, max_bytes_in_flight=None):
+        """Put items concurrently, yielding the results as they complete.
+
+        A failure to put an item does not stop the other items from being
+        put, the exception is yielded instead.
+
+        :param items: iterable of (fpath, relpath) tuples
+        :param max_workers: number of items put at the same time, defaults
+                            to the ``DTOOL_S3_MAX_WORKERS_<bucket>`` setting
+        :param max_bytes_in_flight: cap of the total size of the items put
+                                    at the same time, defaults to 1 GiB
+        :returns: iterator of (relpath, exception or None) tuples in order of
+                  completion
+        """
+        logger.debug("Put items {}".format(self))
+
+        if max_workers is None:
+            max_workers = self._max_workers
+        if max_bytes_in_flight is None:
+            max_bytes_in_flight = _DEFAULT_MAX_BYTES_IN_FLIGHT
+
+        # Resolve the dataset prefix once rather than in every worker.
+        self._get_prefix()
+
+        budget = _ByteBudget(max_bytes_in_flight)
+        slots = threading.Semaphore(max_workers)
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def put(fpath, relpath, size_in_bytes):
+            error = None
+            try:
+                self.put_item(fpath, relpath)
+            except Exception as e:
+                error = e
+            finally:
+                budget.release(size_in_bytes)
+                slots.release()
+            results.put((relpath, error))
+
+        def submit(executor):
+            num_items = 0
+            try:
+                for fpath, relpath in items:
+                    if stop.is_set():
+                        break
+                    num_items += 1
+                    try:
+                        size_in_bytes = os.path.getsize(fpath)
+                    except OSError as e:
+                        results.put((relpath, e))
+                        continue
+                    slots.acquire()
+                    budget.acquire(size_in_bytes)
+                    executor.submit(put, fpath, relpath, size_in_bytes)
+            except Exception as e:
+                results.put((None, e))
+            results.put((None, num_items))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            submitter = threading.Thread(target=submit, args=(executor,))
+            submitter.start()
+            try:
+                num_yielded = 0
+                num_items = None
+                while num_items is None or num_yielded < num_items:
+                    relpath, result = results.get()
+                    if relpath is None:
+                        if isinstance(result, Exception):
+                            raise result
+                        num_items = result
+                        continue
+                    num_yielded += 1
+                    yield relpath, result
+            finally:
+                stop.set()
+                submitter.join()
+
     def add_item_metadata(self, handle, key, value):
         """Store the given key:value pair for the item associated with handle.
 
+        If the ``DTOOL_S3_BUFFER_ITEM_METADATA_<BUCKET NAME>`` setting is
+        enabled the metadata is buffered and written in batches, see
+        :meth:`flush_item_metadata`.
+
         :param handle: handle for accessing an item before the dataset is
                        frozen
         :param key: metadata key
@@ -690,19 +3161,131 @@ class S3StorageBroker(BaseStorageBroker):
         logger.debug("Add item metadata {}".format(self))
 
         identifier = generate_identifier(handle)
-        suffix = '{}.{}.json'.format(identifier, key)
-        bucket_fpath = self.fragments_key_prefix + suffix
 
-        self.s3resource.Object(self.bucket, bucket_fpath).put(
-            Body=json.dumps(value)
+        if self._buffer_item_metadata:
+            self._add_to_item_metadata_buffer(identifier, key, value)
+        else:
+            suffix = '{}.{}.json'.format(identifier, key)
+            bucket_fpath = self.fragments_key_prefix + suffix
+
+            self.s3resource.Object(self.bucket, bucket_fpath).put(
+                Body=json.dumps(value)
+            )
+            self._forget_missing_key(bucket_fpath)
+
+        if self._item_metadata_cache is not None:
+            self._item_metadata_cache.setdefault(identifier, {})[key] = value
+
+    def _add_to_item_metadata_buffer(self, identifier, key, value):
+        if self._item_metadata_finalizer is None:
+            # Make sure that buffered metadata is written even if the storage
+            # broker is garbage collected, or the process exits, before the
+            # buffer has been flushed explicitly.
+            self._item_metadata_finalizer = weakref.finalize(
+                self,
+                _flush_item_metadata_at_exit,
+                self.s3client,
+                self.bucket,
+                self.item_metadata_batch_key_prefix,
+                self._item_metadata_buffer,
+                self._item_metadata_buffer_lock
+            )
+
+        with self._item_metadata_buffer_lock:
+            if len(self._item_metadata_buffer) == 0:
+                self._item_metadata_buffer_started = time.time()
+            self._item_metadata_buffer.setdefault(identifier, {})[key] = value
+            full = len(self._item_metadata_buffer) >= _ITEM_METADATA_BUFFER_SIZE  # NOQA
+            stale = time.time() - self._item_metadata_buffer_started \
+                >= _ITEM_METADATA_BUFFER_SECONDS
+
+        if full or stale:
+            self.flush_item_metadata()
+
+    def flush_item_metadata(self):
+        """Write buffered item metadata to the bucket.
+
+        The buffered metadata is written to a small number of batch objects
+        below the fragments prefix. This is done automatically when the
+        buffer is full, when the dataset is frozen and when the process
+        exits.
+        """
+        if len(self._item_metadata_buffer) == 0:
+            return
+        logger.debug("Flush item metadata {}".format(self))
+        _write_item_metadata_batches(
+            self.s3client,
+            self.bucket,
+            self.item_metadata_batch_key_prefix,
+            self._item_metadata_buffer,
+            self._item_metadata_buffer_lock
         )
 
-    def iter_item_handles(self):
-        """Return iterator over item handles."""
-        logger.debug("Iter item handles {}".format(self))
+    def _add_to_handle_index(self, identifier, relpath):
+        if self._handle_index_finalizer is None:
+            # Make sure that the buffered handles are written even if the
+            # process exits, e.g. after putting a single item, before the
+            # buffer has been flushed explicitly.
+            self._handle_index_finalizer = weakref.finalize(
+                self,
+                _flush_handle_index_at_exit,
+                self.s3client,
+                self.bucket,
+                self.handle_index_key_prefix,
+                self._handle_index_buffer,
+                self._handle_index_lock
+            )
 
-        bucket = self.s3resource.Bucket(self.bucket)
+        with self._handle_index_lock:
+            self._handle_index_buffer[identifier] = relpath
+            full = len(self._handle_index_buffer) >= _HANDLE_INDEX_BATCH_SIZE
+        if full:
+            self.flush_handle_index()
+
+    def flush_handle_index(self):
+        """Write the buffered item handles to a new shard of the handle index.
+
+        The index maps item identifiers to handles so that
+        :meth:`iter_item_handles` does not need to request the metadata of
+        every item. Each flush writes a new, uniquely named, shard so that
+        storage brokers putting items into the same dataset do not overwrite
+        each other's shards. This is done automatically when the buffer is
+        full, when the dataset is frozen and when the process exits.
+        """
+        if len(self._handle_index_buffer) == 0:
+            return
+        logger.debug("Flush handle index {}".format(self))
+        _write_handle_index_shard(
+            self.s3client,
+            self.bucket,
+            self.handle_index_key_prefix,
+            self._handle_index_buffer,
+            self._handle_index_lock
+        )
+
+    def _read_handle_index(self):
+        """Return dictionary mapping identifiers to handles."""
+
+        def read_shard(key):
+            response = self.s3client.get_object(Bucket=self.bucket, Key=key)
+            return json.loads(response['Body'].read().decode('utf-8'))
+
+        shard_keys = (
+            obj["Key"] for obj in
+            _iter_objects(self.s3client, self.bucket, self.handle_index_key_prefix)  # NOQA
+        )
 
+        index = {}
+        for entries in _ordered_map(read_shard, shard_keys, self._max_workers):
+            index.update(entries)
+
+        with self._handle_index_lock:
+            index.update(self._handle_index_buffer)
+
+        return index
+
+    def _base64_encoded_handles(self):
+        """Return True if the item metadata stores base64 encoded handles."""
         # Older dtool-s3 datasets, prior to version 0.14.0, use handles that
         # represent the relative path of the file. These did not support
         # non-ascii charcters. Since 0.14.0 dtool-s3 datasets therefore use
@@ -716,9 +3299,96 @@ class S3StorageBroker(BaseStorageBroker):
                 base64_encoded = False
         else:
             base64_encoded = False
+        return base64_encoded
+
+    def bulk_item_properties(self):
+        """Return dictionary with the properties of all items.
+
+        The dictionary is keyed by item identifier and the values are the
+        same as those returned by :meth:`item_properties`.
+
+        The sizes and timestamps are taken from one paginated listing of the
+        data prefix. The checksums and handles that the storage broker does
+        not know yet are requested using concurrent HEAD requests.
+        """
+        logger.debug("Bulk item properties {}".format(self))
+
+        listing = {}
+        for obj in _iter_objects(self.s3client, self.bucket, self.data_key_prefix):  # NOQA
+            listing[obj["Key"][len(self.data_key_prefix):]] = obj
+
+        unknown_identifiers = [
+            identifier for identifier in listing
+            if identifier not in self._item_head_cache
+        ]
+        for _ in _ordered_map(
+            self._get_item_head,
+            unknown_identifiers,
+            self._max_workers
+        ):
+            pass
+
+        base64_encoded = len(listing) > 0 and self._base64_encoded_handles()
+
+        properties = {}
+        for identifier, obj in listing.items():
+            item_head = self._item_head_cache[identifier]
+            if item_head.checksum is None:
+                raise KeyError('checksum')
+            relpath = item_head.handle
+            if base64_encoded:
+                relpath = _base64_to_unicode(relpath)
+            properties[identifier] = {
+                'size_in_bytes': int(obj["Size"]),
+                'utc_timestamp': time.mktime(obj["LastModified"].timetuple()),
+                'hash': item_head.checksum,
+                'relpath': relpath,
+            }
+
+        return properties
 
-        for obj in bucket.objects.filter(Prefix=self.data_key_prefix).all():
-            handle = obj.get()['Metadata']['handle']
+    def item_properties(self, handle):
+        """Return properties of the item with the given handle."""
+        if self._item_properties_cache is not None:
+            properties = self._item_properties_cache.get(
+                generate_identifier(handle))
+            if properties is not None:
+                return dict(properties)
+        return super(S3StorageBroker, self).item_properties(handle)
+
+    def iter_item_handles(self):
+        """Return iterator over item handles.
+
+        The handles are read from the handle index. Only items missing from
+        the index, for example those put by older versions of dtool-s3, have
+        their handle looked up using a HEAD request.
+        """
+        logger.debug("Iter item handles {}".format(self))
+
+        if self._item_properties_cache is not None:
+            for properties in self._item_properties_cache.values():
+                yield properties['relpath']
+            return
+
+        index = self._read_handle_index()
+
+        missing_identifiers = []
+        for obj in _iter_objects(self.s3client, self.bucket, self.data_key_prefix):  # NOQA
+            identifier = obj["Key"][len(self.data_key_prefix):]
+            if identifier in index:
+                yield index[identifier]
+            else:
+                missing_identifiers.append(identifier)
+
+        if len(missing_identifiers) == 0:
+            return
+
+        base64_encoded = self._base64_encoded_handles()
+
+        def head_handle(identifier):
+            return self._get_item_head(identifier).handle
+
+        for handle in _ordered_map(head_handle, missing_identifiers, self._max_workers):  # NOQA
 
             # The handle is a base64 encoded version of the relpath in order
             # to deal with non-ascii chars in the relpath. We therefore need
@@ -729,32 +3399,132 @@ class S3StorageBroker(BaseStorageBroker):
                 yield handle
 
     def pre_freeze_hook(self):
-        pass
+        self.flush_handle_index()
+        self.flush_item_metadata()
+
+        # Collect the properties and metadata of all items up front so that
+        # generating the manifest and overlays does not need any further
+        # requests.
+        self._item_properties_cache = self.bulk_item_properties()
+        self._item_metadata_cache = self._load_item_metadata()
 
     def post_freeze_hook(self):
         logger.debug("Post freeze hook {}".format(self))
 
-        # Delete the temporary fragment metadata objects from the bucket.
+        self._item_properties_cache = None
+        self._item_metadata_cache = None
 
-        # Get the keys of the fragment metadata objects.
-        bucket = self.s3resource.Bucket(self.bucket)
-        prefix_object_keys = [
-            obj.key for obj in
-            bucket.objects.filter(Prefix=self.fragments_key_prefix).all()
-        ]
+        # The journal and the state of the multipart uploads are only needed
+        # to resume putting items.
+        with self._journal_lock:
+            self._journal = None
+            try:
+                os.remove(self._journal_abspath)
+            except OSError:
+                pass
+        shutil.rmtree(self._uploads_abspath, ignore_errors=True)
+
+        # Delete the temporary fragment metadata objects, the handle index,
+        # which is only used while the dataset is a proto dataset, and any
+        # staging objects left behind by failed uploads, from the bucket.
+        temporary_prefixes = (
+            self.fragments_key_prefix,
+            self.handle_index_key_prefix,
+            self.staging_key_prefix,
+        )
+        temporary_keys = (
+            obj["Key"]
+            for prefix in temporary_prefixes
+            for obj in _iter_objects(self.s3client, self.bucket, prefix)
+        )
+        _bulk_delete(
+            self.s3client,
+            self.bucket,
+            temporary_keys,
+            self._max_workers
+        )
+
+    def _load_item_metadata(self):
+        """Return dictionary with the metadata of all items.
+
+        The dictionary is keyed by item identifier. The fragments prefix is
+        listed once and the fragments, and batches of buffered metadata, are
+        fetched concurrently. Of the values written for the same item and
+        key the one written last is kept.
+        """
+        logger.debug("Load item metadata {}".format(self))
+
+        prefix = self.fragments_key_prefix
+        batch_prefix = self.item_metadata_batch_key_prefix
+
+        def read_fragment(obj):
+            response = self.s3client.get_object(
+                Bucket=self.bucket, Key=obj["Key"])
+            value = json.loads(response['Body'].read().decode('utf-8'))
+            return obj, value
+
+        item_metadata = {}
+        for obj, value in _ordered_map(
+            read_fragment,
+            _iter_objects(self.s3client, self.bucket, prefix),
+            self._max_workers
+        ):
+            key = obj["Key"]
+            if key.startswith(batch_prefix):
+                written_at = _item_metadata_batch_time(key)
+                for identifier, metadata in value.items():
+                    _merge_item_metadata(
+                        item_metadata, identifier, metadata, written_at)
+                continue
+            identifier = key[len(prefix):].split('.', 1)[0]
+            metadata_key = key.split('.')[-2]
+            _merge_item_metadata(
+                item_metadata,
+                identifier,
+                {metadata_key: value},
+                obj["LastModified"].timestamp()
+            )
+
+        metadata_by_identifier = collections.defaultdict(dict)
+        for identifier, metadata in item_metadata.items():
+            for key, (_, value) in metadata.items():
+                metadata_by_identifier[identifier][key] = value
 
-        def _chunks(l, n):  # NOQA
-            """Yield successive n-sized chunks from l."""
+        # Buffered metadata has not been written yet, so it is the latest.
+        with self._item_metadata_buffer_lock:
+            for identifier, metadata in self._item_metadata_buffer.items():
+                metadata_by_identifier[identifier].update(metadata)
 
-            for i in range(0, len(l), n):
-                yield l[i:i + n]
+        return dict(metadata_by_identifier)
 
-        # Delete the chunks of 500 fragment metadata objects.
-        for keys in _chunks(prefix_object_keys, 500):
-            keys_as_list_of_dicts = [{'Key': k} for k in keys]
-            bucket.objects.delete(
-                Delete={'Objects': keys_as_list_of_dicts}
+    def _get_batched_item_metadata(self, identifier):
+        """Return metadata of an item written in batches, as a dictionary of
+        (written_at, value) tuples keyed by metadata key.
+
+        Only the batches of the shard of the item are listed and read, so
+        that batches written by other processes are found.
+        """
+        prefix = self.item_metadata_batch_key_prefix + identifier[0] + "-"
+
+        def read_batch(obj):
+            response = self.s3client.get_object(
+                Bucket=self.bucket, Key=obj["Key"])
+            records = json.loads(response['Body'].read().decode('utf-8'))
+            return obj["Key"], records.get(identifier, {})
+
+        item_metadata = {}
+        for key, metadata in _ordered_map(
+            read_batch,
+            _iter_objects(self.s3client, self.bucket, prefix),
+            self._max_workers
+        ):
+            _merge_item_metadata(
+                item_metadata,
+                identifier,
+                metadata,
+                _item_metadata_batch_time(key)
             )
+        return item_metadata.get(identifier, {})
 
     def get_item_metadata(self, handle):
         """Return dictionary containing all metadata associated with handle.
@@ -768,11 +3538,14 @@ class S3StorageBroker(BaseStorageBroker):
         """
         logger.debug("Get item metadata {}".format(self))
 
+        identifier = generate_identifier(handle)
+        if self._item_metadata_cache is not None:
+            return dict(self._item_metadata_cache.get(identifier, {}))
+
         bucket = self.s3resource.Bucket(self.bucket)
 
-        metadata = {}
+        item_metadata = {}
 
-        identifier = generate_identifier(handle)
         prefix = self.fragments_key_prefix + '{}'.format(identifier)
         for obj in bucket.objects.filter(Prefix=prefix).all():
             metadata_key = obj.key.split('.')[-2]
@@ -780,10 +3553,138 @@ class S3StorageBroker(BaseStorageBroker):
             value_as_string = response['Body'].read().decode('utf-8')
             value = json.loads(value_as_string)
 
-            metadata[metadata_key] = value
+            _merge_item_metadata(
+                item_metadata,
+                identifier,
+                {metadata_key: value},
+                obj.last_modified.timestamp()
+            )
+
+        # Metadata may also have been written in batches, see
+        # add_item_metadata, by this or any other process.
+        batched = self._get_batched_item_metadata(identifier)
+        for metadata_key, (written_at, value) in batched.items():
+            _merge_item_metadata(
+                item_metadata,
+                identifier,
+                {metadata_key: value},
+                written_at
+            )
+
+        metadata = dict(
+            (metadata_key, value) for metadata_key, (_, value)
+            in item_metadata.get(identifier, {}).items()
+        )
+
+        with self._item_metadata_buffer_lock:
+            metadata.update(self._item_metadata_buffer.get(identifier, {}))
 
         return metadata
 
+    # Bucket level dataset catalog.
+
+    @property
+    def _catalog_enabled(self):
+        if not hasattr(self, "_catalog_enabled_cache"):
+            self._catalog_enabled_cache = _get_config_flag(
+                "DTOOL_S3_CATALOG_{}".format(self.bucket))
+        return self._catalog_enabled_cache
+
+    def _catalog_record(self, admin_metadata, size_in_bytes=None):
+        return {
+            "uuid": self.uuid,
+            "name": admin_metadata.get("name"),
+            "prefix": self._get_prefix(),
+            "frozen_at": admin_metadata.get("frozen_at"),
+            "size_in_bytes": size_in_bytes,
+        }
+
+    def update_catalog(self, admin_metadata):
+        """Add or update the record of the dataset in the bucket catalog.
+
+        Called whenever the administrative metadata is written if the
+        ``DTOOL_S3_CATALOG_<BUCKET NAME>`` setting is enabled. Failing to
+        update the catalog is logged, but not raised, as the catalog can be
+        regenerated using :meth:`rebuild_catalog`.
+        """
+        logger.debug("Update catalog {}".format(self))
+
+        record = self._catalog_record(
+            admin_metadata,
+            getattr(self, "_size_in_bytes", None)
+        )
+
+        def update(records):
+            previous = records.get(self.uuid, {})
+            if record["size_in_bytes"] is None:
+                record["size_in_bytes"] = previous.get("size_in_bytes")
+            records[self.uuid] = record
+
+        try:
+            _update_catalog_shard(
+                self.s3client,
+                self.bucket,
+                _catalog_shard_key(self.uuid),
+                update
+            )
+        except ClientError as e:
+            logger.warning("Failed to update catalog: {}".format(e))
+
+    def remove_from_catalog(self):
+        """Remove the record of the dataset from the bucket catalog."""
+        logger.debug("Remove from catalog {}".format(self))
+
+        def update(records):
+            records.pop(self.uuid, None)
+
+        try:
+            _update_catalog_shard(
+                self.s3client,
+                self.bucket,
+                _catalog_shard_key(self.uuid),
+                update
+            )
+        except ClientError as e:
+            logger.warning("Failed to update catalog: {}".format(e))
+
+    def delete_dataset(self):
+        """Permanently delete the dataset from the bucket.
+
+        All objects below the dataset prefix are deleted while they are
+        being listed. The registration key is only deleted once all other
+        objects are gone, so that a partially deleted dataset can still be
+        found and deleted again, and then the dataset is removed from the
+        catalog.
+
+        :returns: list of error dictionaries of the keys that could not be
+                  deleted, empty if the dataset was deleted
+        """
+        logger.debug("Delete dataset {}".format(self))
+
+        prefix = self._get_prefix() + self.uuid + "/"
+        errors = _bulk_delete(
+            self.s3client,
+            self.bucket,
+            (
+                obj["Key"]
+                for obj in _iter_objects(self.s3client, self.bucket, prefix)
+            ),
+            self._max_workers
+        )
+        if len(errors) > 0:
+            return errors
+
+        errors = _bulk_delete(
+            self.s3client,
+            self.bucket,
+            [self.dataset_registration_key],
+            self._max_workers
+        )
+        if len(errors) == 0 and self._catalog_enabled:
+            self.remove_from_catalog()
+
+        return errors
+
     # Signed URL generation for dserver delegate access
 
     def generate_signed_read_url(self, key, expiry_seconds=3600):
@@ -1011,6 +3912,7 @@ class S3StorageBroker(BaseStorageBroker):
         self.s3resource.Object(self.bucket, self.http_manifest_key).put(
             Body=json.dumps(http_manifest, indent=2)
         )
+        self._forget_missing_key(self.http_manifest_key)
 
         return self._generate_key_url(self.http_manifest_key, expiry)
 
@@ -1050,3 +3952,134 @@ class S3StorageBroker(BaseStorageBroker):
             historical_readme_keys.append(obj.key)
 
         return historical_readme_keys
+
+
+def _copy_dataset_metadata(src_storage_broker, dest_storage_broker):
+    """Copy README, overlays, annotations and tags server side, concurrently.
+    """
+    keys = [(
+        src_storage_broker.get_readme_key(),
+        dest_storage_broker.get_readme_key()
+    )]
+    for src_prefix, dest_prefix in (
+        (src_storage_broker.overlays_key_prefix,
+         dest_storage_broker.overlays_key_prefix),
+        (src_storage_broker.annotations_key_prefix,
+         dest_storage_broker.annotations_key_prefix),
+        (src_storage_broker.tags_key_prefix,
+         dest_storage_broker.tags_key_prefix),
+    ):
+        for obj in _iter_objects(
+            src_storage_broker.s3client,
+            src_storage_broker.bucket,
+            src_prefix
+        ):
+            keys.append((obj["Key"], dest_prefix + obj["Key"][len(src_prefix):]))  # NOQA
+
+    def copy_key(src_and_dest_key):
+        src_key, dest_key = src_and_dest_key
+        dest_storage_broker.s3client.copy_object(
+            CopySource={'Bucket': src_storage_broker.bucket, 'Key': src_key},
+            Bucket=dest_storage_broker.bucket,
+            Key=dest_key
+        )
+
+    for _ in _ordered_map(copy_key, keys, dest_storage_broker._max_workers):
+        pass
+
+
+def copy_dataset(
+    src_uri,
+    dest_base_uri,
+    config_path=None,
+    progressbar=None,
+    resume=False,
+):
+    """Copy a dataset to another location, server side if possible.
+
+    If the source dataset and the destination are in S3 buckets on the same
+    endpoint with the same credentials, the items and metadata are copied
+    server side, concurrently, and the checksums in the manifest of the
+    source are reused. Otherwise :func:`dtoolcore.copy`, or
+    :func:`dtoolcore.copy_resume`, is used.
+
+    :param src_uri: URI of dataset to be copied
+    :param dest_base_uri: base of URI for copy target
+    :param config_path: path to dtool configuration file
+    :param progressbar: click progress bar
+    :param resume: resume an interrupted copy, items that have been copied
+                   and have the same size and checksum as in the source
+                   dataset are skipped
+    :returns: URI of new dataset
+    """
+    logger.debug("Copy dataset {} -> {}".format(src_uri, dest_base_uri))
+    src_dataset = dtoolcore.DataSet.from_uri(src_uri, config_path=config_path)
+    src_storage_broker = src_dataset._storage_broker
+
+    dest_parse_result = generous_parse_uri(dest_base_uri)
+    if not isinstance(src_storage_broker, S3StorageBroker) \
+            or dest_parse_result.scheme != S3StorageBroker.key \
+            or S3StorageBroker._get_credentials(dest_parse_result.netloc) \
+            != src_storage_broker._credentials:
+        copy_func = dtoolcore.copy_resume if resume else dtoolcore.copy
+        return copy_func(src_uri, dest_base_uri, config_path, progressbar)
+
+    if resume:
+        dest_uri = S3StorageBroker.generate_uri(
+            src_dataset.name, src_dataset.uuid, dest_base_uri)
+        proto_dataset = dtoolcore.ProtoDataSet.from_uri(
+            dest_uri, config_path=config_path)
+    else:
+        if progressbar:
+            progressbar.label = "Copying dataset"
+        admin_metadata = dict(src_dataset._admin_metadata)
+        admin_metadata["type"] = "protodataset"
+        proto_dataset = dtoolcore.generate_proto_dataset(
+            admin_metadata=admin_metadata,
+            base_uri=dest_base_uri,
+            config_path=config_path
+        )
+        proto_dataset.create()
+    dest_storage_broker = proto_dataset._storage_broker
+
+    # Sizes of the items that have already been copied, keyed by identifier.
+    dest_sizes = {}
+    if resume:
+        data_key_prefix = dest_storage_broker.data_key_prefix
+        for obj in _iter_objects(
+            dest_storage_broker.s3client,
+            dest_storage_broker.bucket,
+            data_key_prefix
+        ):
+            dest_sizes[obj["Key"][len(data_key_prefix):]] = obj["Size"]
+
+    items = src_dataset._manifest["items"]
+
+    def copy_item(identifier):
+        properties = items[identifier]
+        # Objects left behind by an interrupted copy are only kept if they
+        # have the checksum of the item, stored once the copy is complete.
+        if dest_sizes.get(identifier) == properties["size_in_bytes"] \
+                and dest_storage_broker._get_item_head(identifier).checksum \
+                == properties["hash"]:
+            return properties["relpath"]
+        return dest_storage_broker.copy_item(
+            src_storage_broker, identifier, properties)
+
+    for relpath in _ordered_map(
+        copy_item,
+        iter(items),
+        dest_storage_broker._max_workers
+    ):
+        if progressbar:
+            progressbar.item_show_func = lambda x: relpath
+            progressbar.update(1)
+
+    _copy_dataset_metadata(src_storage_broker, dest_storage_broker)
+
+    if resume:
+        proto_dataset._admin_metadata["frozen_at"] = \
+            src_dataset._admin_metadata["frozen_at"]
+    proto_dataset.freeze(progressbar=progressbar)
+
+    return proto_dataset.uri
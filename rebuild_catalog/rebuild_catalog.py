@@ -0,0 +1,23 @@
+import click
+import dtoolcore.utils
+from dtool_s3.storagebroker import S3StorageBroker
+
+
+@click.command()
+@click.argument("base_uri")
+def rebuild_catalog(base_uri):
+    """Regenerate the dataset catalog of a bucket from a listing.
+
+    The catalog is only used if the DTOOL_S3_CATALOG_<BUCKET NAME> setting
+    is enabled.
+    """
+    base_uri = dtoolcore.utils.sanitise_uri(base_uri)
+    num_datasets = S3StorageBroker.rebuild_catalog(base_uri)
+    click.secho(
+        "Catalog rebuilt with {} datasets".format(num_datasets),
+        fg="green"
+    )
+
+
+if __name__ == "__main__":
+    rebuild_catalog()
@@ -8,39 +8,24 @@ from dtool_cli.cli import (
 )
 
 
-def _chunks(l, n):  # NOQA
-    """Yield successive n-sized chunks from l."""
-
-    for i in range(0, len(l), n):
-        yield l[i:i + n]
-
-
-def _all_objects_in_storage_broker(storage_broker):
-
-    bucket = storage_broker.s3resource.Bucket(storage_broker.bucket)
-
-    for obj in bucket.objects.filter(Prefix=storage_broker.uuid).all():
-        yield obj.key
-
-    registration_key = "dtool-{}".format(storage_broker.uuid)
-    yield registration_key
-
-
 def _remove_dataset(dataset):
+    """Remove dataset from bucket, return list of keys that failed."""
 
-    storage_broker = dataset._storage_broker
+    return dataset._storage_broker.delete_dataset()
 
-    object_key_iterator = _all_objects_in_storage_broker(storage_broker)
 
-    object_key_list = list(object_key_iterator)
+def _report_removal(errors):
+    if len(errors) == 0:
+        click.secho("Dataset deleted", fg="green")
+        return
 
-    bucket = storage_broker.s3resource.Bucket(storage_broker.bucket)
-    # Max objects to delete in one API call is 1000, we'll do 500 for safety
-    for keys in _chunks(object_key_list, 500):
-        keys_as_list_of_dicts = [{'Key': k} for k in keys]
-        bucket.objects.delete(
-            Delete={'Objects': keys_as_list_of_dicts}
+    for error in errors:
+        click.secho(
+            "Failed to delete {}: {}".format(error["Key"], error.get("Code")),
+            fg="red",
+            err=True
         )
+    sys.exit(1)
 
 
 def _confirm_dataset_removal(dataset):
@@ -87,8 +72,8 @@ def proto(proto_dataset_uri):
     _confirm_dataset_removal(ds)
 
     # Delete the dataset from the bucket!
-    _remove_dataset(ds)
-    click.secho("Dataset deleted", fg="green")
+    errors = _remove_dataset(ds)
+    _report_removal(errors)
 
 
 @remove_dataset.command()
@@ -101,8 +86,8 @@ def frozen(dataset_uri):
     _confirm_dataset_removal(ds)
 
     # Delete the dataset from the bucket!
-    _remove_dataset(ds)
-    click.secho("Dataset deleted", fg="green")
+    errors = _remove_dataset(ds)
+    _report_removal(errors)
 
 
 if __name__ == "__main__":
@@ -139,3 +139,58 @@ def tmp_uuid_and_uri(request):
         _remove_dataset(uri)
 
     return (uuid, uri)
+
+
+@pytest.fixture
+def storage_broker_factory():
+    """Return function creating storage brokers for tests without S3.
+
+    The registration key of the dataset is reported missing, so that the
+    dataset prefix is taken from the ``DTOOL_S3_DATASET_PREFIX_<bucket>``
+    setting without any further requests. Anything the storage brokers
+    still buffer at the end of the test is not written.
+    """
+    from botocore.stub import Stubber
+    from dtoolcore.utils import generous_parse_uri
+
+    storage_brokers = []
+
+    def storage_broker_factory(uri, prefix="", max_workers=None):
+        bucket = generous_parse_uri(uri).netloc
+        with tmp_env_var("DTOOL_S3_DATASET_PREFIX_" + bucket, prefix):
+            if max_workers is None:
+                storage_broker = S3StorageBroker(uri)
+            else:
+                # The stubber expects the requests in order, a single
+                # thread makes them in order.
+                max_workers_key = "DTOOL_S3_MAX_WORKERS_" + bucket
+                with tmp_env_var(max_workers_key, str(max_workers)):
+                    storage_broker = S3StorageBroker(uri)
+
+        client = storage_broker.s3resource.meta.client
+        with Stubber(client) as stubber:
+            stubber.add_client_error(
+                "get_object",
+                service_error_code="NoSuchKey",
+                http_status_code=404,
+                expected_params={
+                    "Bucket": bucket,
+                    "Key": storage_broker.dataset_registration_key,
+                }
+            )
+            assert storage_broker.data_key_prefix == \
+                prefix + storage_broker.uuid + "/data/"
+            stubber.assert_no_pending_responses()
+
+        storage_brokers.append(storage_broker)
+        return storage_broker
+
+    yield storage_broker_factory
+
+    for storage_broker in storage_brokers:
+        for finalizer in (
+            storage_broker._handle_index_finalizer,
+            storage_broker._item_metadata_finalizer,
+        ):
+            if finalizer is not None:
+                finalizer.detach()
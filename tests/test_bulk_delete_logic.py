@@ -0,0 +1,95 @@
+"""Test the batched deletion of objects."""
+
+from botocore.stub import Stubber
+
+from . import storage_broker_factory  # NOQA
+
+
+def _s3client():
+    from dtool_s3.storagebroker import S3StorageBroker
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("delete-bucket")
+    return s3client
+
+
+def _delete_params(keys):
+    return {
+        "Bucket": "delete-bucket",
+        "Delete": {
+            "Objects": [{"Key": key} for key in keys],
+            "Quiet": True,
+        },
+    }
+
+
+def test_bulk_delete_batches_keys(monkeypatch):
+
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import _bulk_delete
+
+    monkeypatch.setattr(dtool_s3.storagebroker, "_DELETE_BATCH_SIZE", 2)
+
+    s3client = _s3client()
+    keys = ["a", "b", "c"]
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response("delete_objects", {}, _delete_params(["a", "b"]))
+        stubber.add_response("delete_objects", {}, _delete_params(["c"]))
+        errors = _bulk_delete(s3client, "delete-bucket", iter(keys), 1)
+        stubber.assert_no_pending_responses()
+
+    assert errors == []
+
+
+def test_bulk_delete_retries_throttled_keys(monkeypatch):
+
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import _bulk_delete
+
+    monkeypatch.setattr(dtool_s3.storagebroker.time, "sleep", lambda s: None)
+
+    s3client = _s3client()
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "delete_objects",
+            {"Errors": [
+                {"Key": "a", "Code": "SlowDown", "Message": "Slow down"},
+                {"Key": "b", "Code": "AccessDenied", "Message": "Denied"},
+            ]},
+            _delete_params(["a", "b", "c"])
+        )
+        stubber.add_client_error(
+            "delete_objects",
+            service_error_code="ServiceUnavailable",
+            http_status_code=503,
+            expected_params=_delete_params(["a"])
+        )
+        stubber.add_response("delete_objects", {}, _delete_params(["a"]))
+
+        errors = _bulk_delete(s3client, "delete-bucket", ["a", "b", "c"], 1)
+        stubber.assert_no_pending_responses()
+
+    assert [error["Key"] for error in errors] == ["b"]
+    assert errors[0]["Code"] == "AccessDenied"
+
+
+def test_delete_dataset_deletes_registration_key_last(
+    storage_broker_factory,  # NOQA
+):
+
+    storage_broker = storage_broker_factory(
+        "s3://delete-bucket/ds-uuid", max_workers=1)
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [{"Key": "ds-uuid/README.yml"}]},
+            {"Bucket": "delete-bucket", "Prefix": "ds-uuid/"}
+        )
+        stubber.add_response(
+            "delete_objects", {}, _delete_params(["ds-uuid/README.yml"]))
+        stubber.add_response(
+            "delete_objects", {}, _delete_params(["dtool-ds-uuid"]))
+
+        assert storage_broker.delete_dataset() == []
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,76 @@
+"""Test the bulk reading of item properties."""
+
+import datetime
+import time
+
+from botocore.stub import Stubber
+
+from . import storage_broker_factory  # NOQA
+
+
+def test_bulk_item_properties(monkeypatch, storage_broker_factory):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+    from dtool_s3.storagebroker import (
+        _ItemHead,
+        _unicode_to_base64,
+    )
+
+    storage_broker = storage_broker_factory(
+        "s3://bulk-bucket/ds-uuid", max_workers=1)
+    monkeypatch.setattr(
+        storage_broker, "_base64_encoded_handles", lambda: True)
+
+    listed_at = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    id_known = generate_identifier("known.txt")
+    id_unknown = generate_identifier("unknown.txt")
+
+    # Item put by this storage broker.
+    storage_broker._item_head_cache[id_known] = _ItemHead(
+        size_in_bytes=3,
+        last_modified=listed_at,
+        checksum="known-checksum",
+        handle=_unicode_to_base64("known.txt"),
+    )
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [
+                {"Key": "ds-uuid/data/" + id_known, "Size": 3, "LastModified": listed_at},  # NOQA
+                {"Key": "ds-uuid/data/" + id_unknown, "Size": 7, "LastModified": listed_at},  # NOQA
+            ]},
+            {"Bucket": "bulk-bucket", "Prefix": "ds-uuid/data/"}
+        )
+        stubber.add_response(
+            "head_object",
+            {
+                "ContentLength": 7,
+                "LastModified": listed_at,
+                "Metadata": {
+                    "checksum": "unknown-checksum",
+                    "handle": _unicode_to_base64("unknown.txt"),
+                },
+            },
+            {"Bucket": "bulk-bucket", "Key": "ds-uuid/data/" + id_unknown}
+        )
+        stubber.add_response(
+            "list_objects_v2",
+            {},
+            {"Bucket": "bulk-bucket", "Prefix": "ds-uuid/fragments/"}
+        )
+
+        storage_broker.pre_freeze_hook()
+        stubber.assert_no_pending_responses()
+
+        # No further requests while generating the manifest.
+        handles = sorted(storage_broker.iter_item_handles())
+        properties = storage_broker.item_properties("unknown.txt")
+
+    assert handles == ["known.txt", "unknown.txt"]
+    assert properties == {
+        "size_in_bytes": 7,
+        "utc_timestamp": time.mktime(listed_at.timetuple()),
+        "hash": "unknown-checksum",
+        "relpath": "unknown.txt",
+    }
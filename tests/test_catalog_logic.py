@@ -0,0 +1,115 @@
+"""Test the bucket level dataset catalog."""
+
+import io
+import json
+
+from botocore.stub import Stubber, ANY
+
+from . import tmp_env_var
+
+
+def _shard_response(records, etag):
+    body = json.dumps({"datasets": records}).encode("utf-8")
+    return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+def test_update_catalog_shard_retries_lost_race():
+
+    from dtool_s3.storagebroker import (
+        S3StorageBroker,
+        _update_catalog_shard,
+    )
+
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("catalog-bucket")
+
+    key = "dtool-catalog/0.json"
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "get_object",
+            _shard_response({}, '"etag-1"'),
+            {"Bucket": "catalog-bucket", "Key": key}
+        )
+        stubber.add_client_error(
+            "put_object",
+            service_error_code="PreconditionFailed",
+            http_status_code=412,
+        )
+        stubber.add_response(
+            "get_object",
+            _shard_response({"other": {"uuid": "other"}}, '"etag-2"'),
+            {"Bucket": "catalog-bucket", "Key": key}
+        )
+        stubber.add_response(
+            "put_object",
+            {},
+            {
+                "Bucket": "catalog-bucket",
+                "Key": key,
+                "Body": ANY,
+                "ContentType": "application/json",
+                "IfMatch": '"etag-2"',
+            }
+        )
+
+        def update(records):
+            records["mine"] = {"uuid": "mine"}
+
+        assert _update_catalog_shard(s3client, "catalog-bucket", key, update)
+        stubber.assert_no_pending_responses()
+
+
+def test_update_catalog_shard_without_catalog():
+
+    from dtool_s3.storagebroker import (
+        S3StorageBroker,
+        _update_catalog_shard,
+    )
+
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("catalog-bucket")
+
+    with Stubber(s3client) as stubber:
+        stubber.add_client_error(
+            "get_object",
+            service_error_code="NoSuchKey",
+            http_status_code=404,
+        )
+        assert not _update_catalog_shard(
+            s3client,
+            "catalog-bucket",
+            "dtool-catalog/0.json",
+            lambda records: None
+        )
+        stubber.assert_no_pending_responses()
+
+
+def test_list_dataset_uris_from_catalog():
+
+    from dtool_s3.storagebroker import S3StorageBroker, _CATALOG_SHARDS
+
+    bucket_name = "catalog-bucket"
+    max_workers_key = "DTOOL_S3_MAX_WORKERS_" + bucket_name
+    with tmp_env_var(max_workers_key, "1"):
+        _, s3client, _ = S3StorageBroker._get_resource_and_client(bucket_name)
+
+    with Stubber(s3client) as stubber:
+        for c in _CATALOG_SHARDS:
+            records = {}
+            if c == "3":
+                records = {"uuid-b": {}, "uuid-a": {}}
+            stubber.add_response(
+                "get_object",
+                _shard_response(records, '"etag"'),
+                {"Bucket": bucket_name, "Key": "dtool-catalog/" + c + ".json"}
+            )
+
+        with tmp_env_var("DTOOL_S3_CATALOG_" + bucket_name, "true"):
+            with tmp_env_var(max_workers_key, "1"):
+                uris = S3StorageBroker.list_dataset_uris(
+                    "s3://" + bucket_name, None)
+
+        stubber.assert_no_pending_responses()
+
+    assert uris == [
+        "s3://catalog-bucket/uuid-a",
+        "s3://catalog-bucket/uuid-b",
+    ]
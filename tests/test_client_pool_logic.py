@@ -0,0 +1,106 @@
+"""Test the process-wide pool of boto3 clients and resources."""
+
+import os
+import threading
+
+import pytest
+
+from . import tmp_env_var
+
+
+def test_clients_are_shared_between_calls():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    resource1, client1, unsigned1 = \
+        S3StorageBroker._get_resource_and_client("pool-bucket")
+    resource2, client2, unsigned2 = \
+        S3StorageBroker._get_resource_and_client("pool-bucket")
+
+    assert resource1 is resource2
+    assert client1 is client2
+    assert unsigned1 is unsigned2
+    assert client1 is not unsigned1
+
+
+def test_clients_are_keyed_by_credentials():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    _, default_client, _ = \
+        S3StorageBroker._get_resource_and_client("pool-bucket")
+
+    bucket_name = "pool-bucket-custom"
+    with tmp_env_var("DTOOL_S3_ENDPOINT_" + bucket_name, "http://localhost:9000"):  # NOQA
+        with tmp_env_var("DTOOL_S3_ACCESS_KEY_ID_" + bucket_name, "id"):
+            with tmp_env_var("DTOOL_S3_SECRET_ACCESS_KEY_" + bucket_name, "s"):  # NOQA
+                _, custom_client, _ = \
+                    S3StorageBroker._get_resource_and_client(bucket_name)
+
+    assert custom_client is not default_client
+    assert custom_client.meta.endpoint_url == "http://localhost:9000"
+
+
+def test_resources_are_per_thread():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    main_resource, main_client, _ = \
+        S3StorageBroker._get_resource_and_client("pool-bucket")
+
+    results = {}
+
+    def worker():
+        resource, client, _ = \
+            S3StorageBroker._get_resource_and_client("pool-bucket")
+        results["resource"] = resource
+        results["client"] = client
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert results["resource"] is not main_resource
+    assert results["client"] is main_client
+
+
+def test_client_config_applied_to_all_clients():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    bucket_name = "pool-bucket-tuned"
+    with tmp_env_var("DTOOL_S3_MAX_CONCURRENCY_" + bucket_name, "64"):
+        with tmp_env_var("DTOOL_S3_READ_TIMEOUT_" + bucket_name, "120"):
+            with tmp_env_var("DTOOL_S3_RETRY_MODE_" + bucket_name, "adaptive"):  # NOQA
+                storage_broker = S3StorageBroker("s3://" + bucket_name + "/u")
+
+    for client in (
+        storage_broker.s3client,
+        storage_broker.unsigned_s3client,
+        storage_broker.s3resource.meta.client,
+    ):
+        # The pool is large enough for the concurrent part transfers.
+        assert client.meta.config.max_pool_connections == 64
+        assert client.meta.config.read_timeout == 120
+        assert client.meta.config.retries["mode"] == "adaptive"
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "register_at_fork"), reason="requires os.fork")
+def test_storage_broker_clients_not_shared_with_forked_child():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    storage_broker = S3StorageBroker("s3://pool-bucket/u")
+    client = storage_broker.s3client
+    unsigned_client = storage_broker.unsigned_s3client
+
+    pid = os.fork()
+    if pid == 0:
+        shared = storage_broker.s3client is client \
+            or storage_broker.unsigned_s3client is unsigned_client
+        os._exit(1 if shared else 0)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert storage_broker.s3client is client
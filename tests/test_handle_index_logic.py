@@ -0,0 +1,149 @@
+"""Test the persisted index of item handles."""
+
+import datetime
+import io
+import json
+
+from botocore.stub import Stubber, ANY
+
+from . import tmp_dir_fixture, tmp_env_var, storage_broker_factory  # NOQA
+
+URI = "s3://index-bucket/ds-uuid"
+
+
+def test_flush_handle_index(storage_broker_factory):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+
+    storage_broker = storage_broker_factory(URI, max_workers=1)
+    identifier = generate_identifier("a.txt")
+    storage_broker._add_to_handle_index(identifier, "a.txt")
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "put_object",
+            {},
+            {
+                "Bucket": "index-bucket",
+                "Key": ANY,
+                "Body": json.dumps({identifier: "a.txt"}, separators=(",", ":")),  # NOQA
+            }
+        )
+        storage_broker.flush_handle_index()
+        # Nothing left to flush.
+        storage_broker.flush_handle_index()
+        stubber.assert_no_pending_responses()
+
+
+def test_handle_index_flushed_at_exit(storage_broker_factory):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+
+    storage_broker = storage_broker_factory(URI, max_workers=1)
+    identifier = generate_identifier("a.txt")
+    storage_broker._add_to_handle_index(identifier, "a.txt")
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "put_object",
+            {},
+            {
+                "Bucket": "index-bucket",
+                "Key": ANY,
+                "Body": json.dumps({identifier: "a.txt"}, separators=(",", ":")),  # NOQA
+            }
+        )
+        # Called when the storage broker is garbage collected, or the
+        # process exits.
+        storage_broker._handle_index_finalizer()
+        stubber.assert_no_pending_responses()
+
+    assert storage_broker._handle_index_buffer == {}
+
+
+def test_iter_item_handles_uses_index(
+    monkeypatch,
+    storage_broker_factory,  # NOQA
+):
+
+    from dtoolcore.utils import generate_identifier
+    from dtool_s3.storagebroker import _unicode_to_base64
+
+    storage_broker = storage_broker_factory(URI, max_workers=1)
+    monkeypatch.setattr(
+        storage_broker, "_base64_encoded_handles", lambda: True)
+
+    id_indexed = generate_identifier("indexed.txt")
+    id_buffered = generate_identifier("buffered.txt")
+    id_missing = generate_identifier("missing.txt")
+
+    storage_broker._add_to_handle_index(id_buffered, "buffered.txt")
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [{"Key": "ds-uuid/handle_index/1-a.json"}]},
+            {"Bucket": "index-bucket", "Prefix": "ds-uuid/handle_index/"}
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(json.dumps({id_indexed: "indexed.txt"}).encode())},  # NOQA
+            {"Bucket": "index-bucket", "Key": "ds-uuid/handle_index/1-a.json"}
+        )
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [
+                {"Key": "ds-uuid/data/" + id_indexed},
+                {"Key": "ds-uuid/data/" + id_buffered},
+                {"Key": "ds-uuid/data/" + id_missing},
+            ]},
+            {"Bucket": "index-bucket", "Prefix": "ds-uuid/data/"}
+        )
+        stubber.add_response(
+            "head_object",
+            {
+                "ContentLength": 1,
+                "LastModified": datetime.datetime(2024, 1, 1),
+                "Metadata": {"handle": _unicode_to_base64("missing.txt")},
+            },
+            {"Bucket": "index-bucket", "Key": "ds-uuid/data/" + id_missing}
+        )
+
+        handles = list(storage_broker.iter_item_handles())
+        stubber.assert_no_pending_responses()
+
+    assert handles == ["indexed.txt", "buffered.txt", "missing.txt"]
+
+
+def test_handle_index_deleted_after_freeze(
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", tmp_dir_fixture):
+        storage_broker = storage_broker_factory(URI, max_workers=1)
+
+    with Stubber(storage_broker.s3client) as stubber:
+        for prefix, keys in (
+            ("ds-uuid/fragments/", []),
+            ("ds-uuid/handle_index/", ["ds-uuid/handle_index/1-a.json"]),
+            ("ds-uuid/staging/", []),
+        ):
+            stubber.add_response(
+                "list_objects_v2",
+                {"Contents": [{"Key": key} for key in keys]},
+                {"Bucket": "index-bucket", "Prefix": prefix}
+            )
+        stubber.add_response(
+            "delete_objects",
+            {},
+            {
+                "Bucket": "index-bucket",
+                "Delete": {
+                    "Objects": [{"Key": "ds-uuid/handle_index/1-a.json"}],
+                    "Quiet": True,
+                },
+            }
+        )
+        storage_broker.post_freeze_hook()
+        stubber.assert_no_pending_responses()
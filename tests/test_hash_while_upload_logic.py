@@ -0,0 +1,154 @@
+"""Test computing the checksum of items while they are uploaded."""
+
+import hashlib
+import os
+
+from botocore.stub import Stubber, ANY
+
+from . import tmp_dir_fixture  # NOQA
+
+
+def _write_file(directory, content):
+    fpath = os.path.join(directory, "item.bin")
+    with open(fpath, "wb") as fh:
+        fh.write(content)
+    return fpath
+
+
+def test_small_file_uploaded_with_single_put(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import S3StorageBroker, _upload_file_hashing
+
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("hash-bucket")
+    fpath = _write_file(tmp_dir_fixture, b"hello")
+    extra_args = {"Metadata": {"handle": "aGVsbG8="}}
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "put_object",
+            {},
+            {
+                "Bucket": "hash-bucket",
+                "Key": "ds-uuid/data/id",
+                "Body": b"hello",
+                "ContentMD5": ANY,
+                "Metadata": {
+                    "handle": "aGVsbG8=",
+                    "checksum": "5d41402abc4b2a76b9719d911017c592",
+                },
+            }
+        )
+        assert _upload_file_hashing(
+            s3client,
+            fpath,
+            "hash-bucket",
+            "ds-uuid/data/id",
+            extra_args,
+            staging_path="ds-uuid/staging/id"
+        )
+        stubber.assert_no_pending_responses()
+
+    assert extra_args["Metadata"]["checksum"] == "5d41402abc4b2a76b9719d911017c592"  # NOQA
+
+
+def test_file_below_threshold_streamed_from_disk(
+    monkeypatch,
+    tmp_dir_fixture,  # NOQA
+):
+
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import S3StorageBroker, _upload_file_hashing
+
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_HASHING_MAX_BYTES_IN_MEMORY", 2)
+
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("hash-bucket")
+    fpath = _write_file(tmp_dir_fixture, b"hello")
+    extra_args = {"Metadata": {"handle": "aGVsbG8="}}
+    bodies = []
+
+    def record_body(params, **kwargs):
+        bodies.append(params["Body"].read())
+        params["Body"].seek(0)
+
+    event_name = "provide-client-params.s3.PutObject"
+    s3client.meta.events.register(event_name, record_body)
+    try:
+        with Stubber(s3client) as stubber:
+            stubber.add_response("put_object", {})
+            assert _upload_file_hashing(
+                s3client,
+                fpath,
+                "hash-bucket",
+                "ds-uuid/data/id",
+                extra_args,
+                staging_path="ds-uuid/staging/id"
+            )
+            stubber.assert_no_pending_responses()
+    finally:
+        s3client.meta.events.unregister(event_name, record_body)
+
+    assert bodies == [b"hello"]
+    assert extra_args["Metadata"]["checksum"] == "5d41402abc4b2a76b9719d911017c592"  # NOQA
+
+
+class _RecordingClient(object):
+    """Stand in for the managed transfer methods of an S3 client."""
+
+    def __init__(self):
+        self.calls = []
+
+    def upload_fileobj(self, fileobj, bucket, key, Config=None):
+        assert not hasattr(fileobj, "seek")
+        body = b""
+        while True:
+            chunk = fileobj.read(4)
+            if len(chunk) == 0:
+                break
+            body += chunk
+        self.calls.append(("upload_fileobj", key, body))
+        self.upload_config = Config
+
+    def copy(self, source, bucket, key, ExtraArgs=None, Config=None):
+        self.calls.append(("copy", source["Key"], key, ExtraArgs))
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append(("delete_object", Key))
+
+
+def test_large_file_streamed_to_staging_key(tmp_dir_fixture):  # NOQA
+
+    import boto3.s3.transfer
+    from dtool_s3.storagebroker import _upload_file_hashing
+
+    content = b"0123456789" * 3
+    fpath = _write_file(tmp_dir_fixture, content)
+    extra_args = {"Metadata": {"handle": "aGVsbG8="}}
+    config = boto3.s3.transfer.TransferConfig(
+        multipart_threshold=10,
+        multipart_chunksize=5
+    )
+
+    s3client = _RecordingClient()
+    assert _upload_file_hashing(
+        s3client,
+        fpath,
+        "hash-bucket",
+        "ds-uuid/data/id",
+        extra_args,
+        staging_path="ds-uuid/staging/id",
+        config=config
+    )
+
+    checksum = hashlib.md5(content).hexdigest()
+    assert s3client.calls == [
+        ("upload_fileobj", "ds-uuid/staging/id", content),
+        ("copy", "ds-uuid/staging/id", "ds-uuid/data/id", {
+            "Metadata": {"handle": "aGVsbG8=", "checksum": checksum},
+            "MetadataDirective": "REPLACE",
+        }),
+        ("delete_object", "ds-uuid/staging/id"),
+    ]
+    # At most a single part of the stream is read into memory up front.
+    assert s3client.upload_config.multipart_threshold == 5
+    assert config.multipart_threshold == 10
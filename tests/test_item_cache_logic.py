@@ -0,0 +1,228 @@
+"""Test the local cache of downloaded items."""
+
+import datetime
+import os
+
+from botocore.stub import Stubber
+
+from . import tmp_dir_fixture, tmp_env_var, storage_broker_factory  # NOQA
+
+
+URI = "s3://cache-bucket/ds-uuid"
+
+
+def _fake_download(content, downloads):
+    def download_file(s3client, bucket, key, fpath, config):
+        downloads.append(key)
+        with open(fpath, "wb") as fh:
+            fh.write(content)
+    return download_file
+
+
+def test_cache_hit_makes_no_requests(
+    monkeypatch,
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    import dtool_s3.storagebroker
+    from dtoolcore.utils import generate_identifier
+
+    identifier = generate_identifier("a.txt")
+    downloads = []
+    monkeypatch.setattr(
+        dtool_s3.storagebroker,
+        "_download_file",
+        _fake_download(b"hello", downloads)
+    )
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", tmp_dir_fixture):
+        storage_broker = storage_broker_factory(URI)
+        with Stubber(storage_broker.s3client) as stubber:
+            stubber.add_response(
+                "head_object",
+                {
+                    "ContentLength": 5,
+                    "LastModified": datetime.datetime(2024, 1, 1),
+                    "Metadata": {"handle": "a.txt"},
+                },
+                {"Bucket": "cache-bucket", "Key": "ds-uuid/data/" + identifier}  # NOQA
+            )
+            abspath = storage_broker.get_item_abspath(identifier)
+            stubber.assert_no_pending_responses()
+
+        assert abspath == os.path.join(
+            tmp_dir_fixture, "ds-uuid", identifier + ".txt")
+        with open(abspath, "rb") as fh:
+            assert fh.read() == b"hello"
+
+        # Another process reading the same dataset.
+        storage_broker = storage_broker_factory(URI)
+        with Stubber(storage_broker.s3client) as stubber:
+            assert storage_broker.get_item_abspath(identifier) == abspath
+            stubber.assert_no_pending_responses()
+
+    assert downloads == ["ds-uuid/data/" + identifier]
+
+
+def test_concurrent_requests_share_one_download(
+    monkeypatch,
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    import threading
+    import time
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import _ItemHead
+    from dtoolcore.utils import generate_identifier
+
+    identifier = generate_identifier("a.txt")
+    downloads = []
+    fake_download = _fake_download(b"hello", downloads)
+
+    def slow_download(*args):
+        # Give the other threads time to ask for the item.
+        time.sleep(0.2)
+        fake_download(*args)
+
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_download_file", slow_download)
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", tmp_dir_fixture):
+        storage_broker = storage_broker_factory(URI)
+        monkeypatch.setattr(
+            storage_broker,
+            "_get_item_head",
+            lambda identifier: _ItemHead(
+                size_in_bytes=5, last_modified=None, checksum=None,
+                handle="a.txt")
+        )
+
+        abspaths = []
+
+        def get_item_abspath():
+            abspaths.append(storage_broker.get_item_abspath(identifier))
+
+        threads = [threading.Thread(target=get_item_abspath) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    expected = os.path.join(tmp_dir_fixture, "ds-uuid", identifier + ".txt")
+    assert abspaths == [expected] * 8
+    assert downloads == ["ds-uuid/data/" + identifier]
+    # No temporary or lock files are left behind.
+    assert sorted(os.listdir(os.path.join(tmp_dir_fixture, "ds-uuid"))) == [
+        ".dtool-s3-index", ".locks", identifier + ".txt"]
+    assert os.listdir(os.path.join(tmp_dir_fixture, "ds-uuid", ".locks")) \
+        == []
+
+
+def test_item_downloaded_by_another_process(
+    monkeypatch,
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", tmp_dir_fixture):
+        with tmp_env_var("DTOOL_S3_CACHE_MAX_BYTES", "100"):
+            storage_broker = storage_broker_factory(URI)
+
+    enforced = []
+    monkeypatch.setattr(
+        storage_broker,
+        "_enforce_cache_budget",
+        lambda abspath, size_in_bytes: enforced.append(abspath)
+    )
+
+    # Downloaded by another process while waiting for the lock.
+    abspaths = _cache_items(tmp_dir_fixture, [5])
+
+    with Stubber(storage_broker.s3client) as stubber:
+        assert storage_broker._download_item("id0") == abspaths[0]
+        stubber.assert_no_pending_responses()
+
+    assert enforced == []
+
+
+def test_read_cache_index_from_offset(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import _read_cache_index
+
+    fpath = os.path.join(tmp_dir_fixture, "index")
+    with open(fpath, "w") as fh:
+        fh.write('["id1", "id1.txt"]\n["id2", "id')
+
+    cache_index, offset = _read_cache_index(fpath)
+    assert cache_index == {"id1": "id1.txt"}
+
+    with open(fpath, "a") as fh:
+        fh.write('2.txt"]\n')
+
+    cache_index, offset = _read_cache_index(fpath, offset)
+    assert cache_index == {"id2": "id2.txt"}
+    assert offset == os.path.getsize(fpath)
+
+
+def _cache_items(cache_abspath, sizes):
+    """Create cached items, the first being the least recently used."""
+    dataset_cache_abspath = os.path.join(cache_abspath, "ds-uuid")
+    os.makedirs(dataset_cache_abspath)
+    abspaths = []
+    with open(os.path.join(dataset_cache_abspath, ".dtool-s3-index"), "w") as index_fh:  # NOQA
+        for i, size in enumerate(sizes):
+            fname = "id{}".format(i)
+            abspath = os.path.join(dataset_cache_abspath, fname)
+            with open(abspath, "wb") as fh:
+                fh.write(b"x" * size)
+            os.utime(abspath, (i, i))
+            index_fh.write('["{}", "{}"]\n'.format(fname, fname))
+            abspaths.append(abspath)
+    return abspaths
+
+
+def test_evict_least_recently_used(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import _evict_cache
+
+    abspaths = _cache_items(tmp_dir_fixture, [40, 40, 40, 40])
+    locks_abspath = os.path.join(tmp_dir_fixture, "ds-uuid", ".locks")
+    os.makedirs(locks_abspath)
+    for i in range(4):
+        open(os.path.join(locks_abspath, "id{}".format(i)), "w").close()
+
+    # Within budget, nothing is evicted.
+    assert _evict_cache(tmp_dir_fixture, 200) == 160
+
+    # Evicted down to 90% of the budget, along with the lock files.
+    assert _evict_cache(tmp_dir_fixture, 100, keep={abspaths[0]}) == 80
+    assert [os.path.exists(p) for p in abspaths] == [True, False, False, True]
+    assert sorted(os.listdir(locks_abspath)) == ["id0", "id3"]
+
+
+def test_pinned_items_are_not_evicted(
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    import pytest
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import _evict_cache
+
+    if dtool_s3.storagebroker.fcntl is None:
+        pytest.skip("Pinning across processes needs fcntl")
+
+    cache_abspath = os.path.join(tmp_dir_fixture, "cache")
+    abspaths = _cache_items(cache_abspath, [40, 40])
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", cache_abspath):
+        storage_broker = storage_broker_factory(URI)
+        assert storage_broker.pin_item("id0") == abspaths[0]
+
+    assert _evict_cache(cache_abspath, 50) == 40
+    assert [os.path.exists(p) for p in abspaths] == [True, False]
+
+    storage_broker.unpin_item("id0")
+    assert _evict_cache(cache_abspath, 30) == 0
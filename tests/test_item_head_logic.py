@@ -0,0 +1,106 @@
+"""Test the cached HEAD based reading of item metadata."""
+
+import datetime
+import time
+
+from botocore.stub import Stubber
+
+from . import tmp_dir_fixture, storage_broker_factory  # NOQA
+
+
+def test_item_properties_use_single_head_request(
+    storage_broker_factory,  # NOQA
+):
+
+    from dtoolcore.utils import generate_identifier
+    from dtool_s3.storagebroker import _unicode_to_base64
+
+    storage_broker = storage_broker_factory("s3://head-bucket/ds-uuid")
+
+    last_modified = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    identifier = generate_identifier("dir/a.txt")
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "head_object",
+            {
+                "ContentLength": 42,
+                "LastModified": last_modified,
+                "Metadata": {
+                    "checksum": "d41d8cd98f00b204e9800998ecf8427e",
+                    "handle": _unicode_to_base64("dir/a.txt"),
+                },
+            },
+            {"Bucket": "head-bucket", "Key": "ds-uuid/data/" + identifier}
+        )
+
+        properties = storage_broker.item_properties("dir/a.txt")
+        stubber.assert_no_pending_responses()
+
+    assert properties == {
+        "size_in_bytes": 42,
+        "utc_timestamp": time.mktime(last_modified.timetuple()),
+        "hash": "d41d8cd98f00b204e9800998ecf8427e",
+        "relpath": "dir/a.txt",
+    }
+
+
+def test_uploaded_item_properties_need_single_request(
+    monkeypatch,
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    import os
+    import dtool_s3.storagebroker
+    from dtoolcore.utils import generate_identifier
+    from dtool_s3.storagebroker import _unicode_to_base64
+
+    monkeypatch.setattr(
+        dtool_s3.storagebroker,
+        "_put_item_with_retry",
+        lambda **kwargs: {"attempts": 1, "retry_time": 0.0}
+    )
+
+    fpath = os.path.join(tmp_dir_fixture, "a.txt")
+    with open(fpath, "w") as fh:
+        fh.write("hello")
+
+    storage_broker = storage_broker_factory("s3://head-bucket/ds-uuid")
+
+    last_modified = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    identifier = generate_identifier("dir/a.txt")
+
+    with Stubber(storage_broker.s3client) as stubber:
+        storage_broker.put_item(fpath, "dir/a.txt")
+        assert storage_broker.get_size_in_bytes("dir/a.txt") == 5
+        assert storage_broker.get_hash("dir/a.txt") == \
+            "5d41402abc4b2a76b9719d911017c592"
+        stubber.assert_no_pending_responses()
+
+        # The last modified time is set by S3, it is requested once.
+        stubber.add_response(
+            "head_object",
+            {
+                "ContentLength": 5,
+                "LastModified": last_modified,
+                "Metadata": {
+                    "checksum": "5d41402abc4b2a76b9719d911017c592",
+                    "handle": _unicode_to_base64("dir/a.txt"),
+                },
+            },
+            {"Bucket": "head-bucket", "Key": "ds-uuid/data/" + identifier}
+        )
+        properties = storage_broker.item_properties("dir/a.txt")
+        assert storage_broker.item_properties("dir/a.txt") == properties
+        stubber.assert_no_pending_responses()
+
+    assert properties["utc_timestamp"] == time.mktime(last_modified.timetuple())  # NOQA
+    assert properties["size_in_bytes"] == 5
+    assert properties["hash"] == "5d41402abc4b2a76b9719d911017c592"
+    assert properties["relpath"] == "dir/a.txt"
+    assert storage_broker.get_put_item_stats() == {
+        "items": 1,
+        "attempts": 1,
+        "retry_time": 0.0,
+    }
@@ -0,0 +1,205 @@
+"""Test the loading of item metadata fragments."""
+
+import datetime
+import io
+import json
+
+from botocore.stub import Stubber, ANY
+
+from . import tmp_env_var, storage_broker_factory  # NOQA
+
+
+def test_load_item_metadata_lists_fragments_once(
+    storage_broker_factory,  # NOQA
+):
+
+    from dtoolcore.utils import generate_identifier
+
+    storage_broker = storage_broker_factory(
+        "s3://fragment-bucket/ds-uuid", max_workers=1)
+
+    identifier = generate_identifier("a.txt")
+    prefix = "ds-uuid/fragments/"
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [
+                {"Key": prefix + identifier + ".colour.json",
+                 "LastModified": datetime.datetime(2024, 1, 1)},
+                {"Key": prefix + identifier + ".size.json",
+                 "LastModified": datetime.datetime(2024, 1, 1)},
+            ]},
+            {"Bucket": "fragment-bucket", "Prefix": prefix}
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(json.dumps("red").encode())},
+            {"Bucket": "fragment-bucket", "Key": prefix + identifier + ".colour.json"}  # NOQA
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(json.dumps(3).encode())},
+            {"Bucket": "fragment-bucket", "Key": prefix + identifier + ".size.json"}  # NOQA
+        )
+
+        storage_broker._item_metadata_cache = \
+            storage_broker._load_item_metadata()
+        stubber.assert_no_pending_responses()
+
+        # Answered from the snapshot without any requests.
+        assert storage_broker.get_item_metadata("a.txt") == {
+            "colour": "red",
+            "size": 3,
+        }
+        assert storage_broker.get_item_metadata("b.txt") == {}
+
+
+def test_buffered_item_metadata(storage_broker_factory):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+
+    with tmp_env_var("DTOOL_S3_BUFFER_ITEM_METADATA_fragment-bucket", "true"):
+        storage_broker = storage_broker_factory(
+            "s3://fragment-bucket/ds-uuid", max_workers=1)
+
+    identifier = generate_identifier("a.txt")
+    batch_body = json.dumps(
+        {identifier: {"colour": "red", "size": 3}},
+        separators=(",", ":")
+    )
+    batch_prefix = "ds-uuid/fragments/batches/" + identifier[0] + "-"
+
+    with Stubber(storage_broker.s3client) as stubber:
+        # Buffered, no requests.
+        storage_broker.add_item_metadata("a.txt", "colour", "red")
+        storage_broker.add_item_metadata("a.txt", "size", 3)
+        assert storage_broker._item_metadata_buffer == {
+            identifier: {"colour": "red", "size": 3}
+        }
+
+        stubber.add_response(
+            "put_object",
+            {},
+            {"Bucket": "fragment-bucket", "Key": ANY, "Body": batch_body}
+        )
+        storage_broker.flush_item_metadata()
+        stubber.assert_no_pending_responses()
+
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [{"Key": batch_prefix + "1-a.json"}]},
+            {"Bucket": "fragment-bucket", "Prefix": "ds-uuid/fragments/"}
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(batch_body.encode())},
+            {"Bucket": "fragment-bucket", "Key": batch_prefix + "1-a.json"}
+        )
+        item_metadata = storage_broker._load_item_metadata()
+        stubber.assert_no_pending_responses()
+
+    assert item_metadata == {identifier: {"colour": "red", "size": 3}}
+
+
+def test_latest_item_metadata_takes_precedence(storage_broker_factory):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+
+    storage_broker = storage_broker_factory(
+        "s3://fragment-bucket/ds-uuid", max_workers=1)
+
+    identifier = generate_identifier("a.txt")
+    prefix = "ds-uuid/fragments/"
+    # Written on 2024-01-01 12:00 UTC, between the two fragments.
+    batch_key = prefix + "batches/{}-{:020d}-a.json".format(
+        identifier[0], 1704110400 * 10**9)
+    tz = datetime.timezone.utc
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [
+                {"Key": batch_key},
+                {"Key": prefix + identifier + ".colour.json",
+                 "LastModified": datetime.datetime(2024, 1, 1, tzinfo=tz)},
+                {"Key": prefix + identifier + ".size.json",
+                 "LastModified": datetime.datetime(2024, 1, 2, tzinfo=tz)},
+            ]},
+            {"Bucket": "fragment-bucket", "Prefix": prefix}
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(json.dumps(
+                {identifier: {"colour": "blue", "size": 2}}).encode())},
+            {"Bucket": "fragment-bucket", "Key": batch_key}
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(json.dumps("red").encode())},
+            {"Bucket": "fragment-bucket", "Key": prefix + identifier + ".colour.json"}  # NOQA
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(json.dumps(3).encode())},
+            {"Bucket": "fragment-bucket", "Key": prefix + identifier + ".size.json"}  # NOQA
+        )
+        item_metadata = storage_broker._load_item_metadata()
+        stubber.assert_no_pending_responses()
+
+    assert item_metadata == {identifier: {"colour": "blue", "size": 3}}
+
+
+def test_get_item_metadata_reads_batches_of_item_shard(
+    storage_broker_factory,  # NOQA
+):
+
+    from dtoolcore.utils import generate_identifier
+
+    # Batches are read whether or not this storage broker buffers metadata.
+    storage_broker = storage_broker_factory(
+        "s3://fragment-bucket/ds-uuid", max_workers=1)
+
+    identifier = generate_identifier("a.txt")
+    batch_prefix = "ds-uuid/fragments/batches/" + identifier[0] + "-"
+    batch_keys = [
+        batch_prefix + "{:020d}-a.json".format(1),
+        batch_prefix + "{:020d}-b.json".format(2),
+    ]
+    batch_bodies = [
+        {identifier: {"colour": "red", "size": 3}, "other": {"size": 1}},
+        {identifier: {"colour": "blue"}},
+    ]
+
+    resource_client = storage_broker.s3resource.meta.client
+    with Stubber(storage_broker.s3client) as stubber, \
+            Stubber(resource_client) as resource_stubber:
+        for _ in range(2):
+            resource_stubber.add_response(
+                "list_objects",
+                {"Contents": []},
+                {
+                    "Bucket": "fragment-bucket",
+                    "Prefix": "ds-uuid/fragments/" + identifier,
+                }
+            )
+            stubber.add_response(
+                "list_objects_v2",
+                {"Contents": [{"Key": key} for key in batch_keys]},
+                {"Bucket": "fragment-bucket", "Prefix": batch_prefix}
+            )
+            for key, body in zip(batch_keys, batch_bodies):
+                stubber.add_response(
+                    "get_object",
+                    {"Body": io.BytesIO(json.dumps(body).encode())},
+                    {"Bucket": "fragment-bucket", "Key": key}
+                )
+
+        # Each call lists the batches again, to find those written since.
+        for _ in range(2):
+            assert storage_broker.get_item_metadata("a.txt") == {
+                "colour": "blue",
+                "size": 3,
+            }
+        stubber.assert_no_pending_responses()
+        resource_stubber.assert_no_pending_responses()
@@ -0,0 +1,121 @@
+"""Test that creating a storage broker does not touch the network."""
+
+import io
+
+from botocore.stub import Stubber
+
+from . import storage_broker_factory  # NOQA
+
+
+def test_init_does_not_resolve_clients_or_prefix(monkeypatch):
+
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    def get_pooled(*args):
+        raise AssertionError("Client requested")
+
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_get_pooled_client", get_pooled)
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_get_pooled_resource", get_pooled)
+
+    storage_broker = S3StorageBroker("s3://lazy-bucket/some-uuid")
+
+    assert not hasattr(storage_broker, "_prefix")
+
+
+def test_prefix_resolved_on_first_use():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    storage_broker = S3StorageBroker("s3://lazy-bucket/some-uuid")
+
+    client = storage_broker.s3resource.meta.client
+    with Stubber(client) as stubber:
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(b"u/olssont/")},
+            {"Bucket": "lazy-bucket", "Key": "dtool-some-uuid"}
+        )
+        assert storage_broker.data_key_prefix == "u/olssont/some-uuid/data/"
+        # The prefix is only read once.
+        assert storage_broker.tags_key_prefix == "u/olssont/some-uuid/tags/"
+        stubber.assert_no_pending_responses()
+
+
+def test_structure_parameters_not_shared():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    broker1 = S3StorageBroker("s3://lazy-bucket/uuid-1")
+    broker2 = S3StorageBroker("s3://lazy-bucket/uuid-2")
+
+    assert broker1._structure_parameters["dataset_registration_key"] == "dtool-uuid-1"  # NOQA
+    assert broker2._structure_parameters["dataset_registration_key"] == "dtool-uuid-2"  # NOQA
+
+
+def test_missing_keys_are_remembered():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    storage_broker = S3StorageBroker("s3://lazy-bucket/some-uuid")
+
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_client_error(
+            "head_object",
+            service_error_code="404",
+            http_status_code=404,
+            expected_params={"Bucket": "lazy-bucket", "Key": "missing"}
+        )
+        assert not storage_broker.object_exists("missing")
+        # The second probe is answered from the negative cache.
+        assert not storage_broker.object_exists("missing")
+        stubber.assert_no_pending_responses()
+
+
+def test_written_keys_are_no_longer_missing(storage_broker_factory):  # NOQA
+
+    from botocore.stub import ANY
+
+    storage_broker = storage_broker_factory("s3://lazy-bucket/some-uuid")
+    key = storage_broker.get_admin_metadata_key()
+
+    resource_client = storage_broker.s3resource.meta.client
+    with Stubber(storage_broker.s3client) as stubber, \
+            Stubber(resource_client) as resource_stubber:
+        stubber.add_client_error(
+            "head_object",
+            service_error_code="404",
+            http_status_code=404,
+            expected_params={"Bucket": "lazy-bucket", "Key": key}
+        )
+        resource_stubber.add_response(
+            "put_object",
+            {},
+            {"Bucket": "lazy-bucket", "Key": key, "Body": ANY, "Metadata": ANY}
+        )
+        stubber.add_response(
+            "head_object",
+            {},
+            {"Bucket": "lazy-bucket", "Key": key}
+        )
+        assert not storage_broker.object_exists(key)
+        storage_broker.put_admin_metadata({"uuid": "some-uuid"})
+        assert storage_broker.object_exists(key)
+        stubber.assert_no_pending_responses()
+        resource_stubber.assert_no_pending_responses()
+
+
+def test_missing_keys_are_bounded(monkeypatch):
+
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    monkeypatch.setattr(dtool_s3.storagebroker, "_MISSING_KEY_CACHE_SIZE", 4)
+    storage_broker = S3StorageBroker("s3://lazy-bucket/some-uuid")
+
+    for i in range(10):
+        storage_broker._remember_missing_key(str(i))
+    assert len(storage_broker._missing_keys) <= 4
+    assert "9" in storage_broker._missing_keys
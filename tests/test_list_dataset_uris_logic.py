@@ -0,0 +1,82 @@
+"""Test the concurrent discovery of datasets in a bucket."""
+
+import io
+
+from botocore.stub import Stubber
+
+from . import tmp_env_var
+
+
+def test_iter_dataset_uris():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    bucket_name = "listing-bucket"
+    # The stubber expects the requests in order, use a single thread.
+    max_workers_key = "DTOOL_S3_MAX_WORKERS_" + bucket_name
+    with tmp_env_var(max_workers_key, "1"):
+        _, s3client, _ = S3StorageBroker._get_resource_and_client(bucket_name)
+
+    listing = {
+        "Contents": [
+            {"Key": "dtool-uuid-1", "Size": 0},
+            {"Key": "dtool-uuid-2", "Size": 10},
+            {"Key": "dtool-uuid-3", "Size": 0},
+        ],
+        "IsTruncated": False,
+    }
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            listing,
+            {"Bucket": bucket_name, "Prefix": "dtool-", "Delimiter": "/"}
+        )
+        stubber.add_response(
+            "head_object",
+            {},
+            {"Bucket": bucket_name, "Key": "uuid-1/dtool"}
+        )
+        stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(b"u/olssont/")},
+            {"Bucket": bucket_name, "Key": "dtool-uuid-2"}
+        )
+        stubber.add_response(
+            "head_object",
+            {},
+            {"Bucket": bucket_name, "Key": "u/olssont/uuid-2/dtool"}
+        )
+        # Registration key without any administrative metadata.
+        stubber.add_client_error(
+            "head_object",
+            service_error_code="404",
+            http_status_code=404,
+            expected_params={"Bucket": bucket_name, "Key": "uuid-3/dtool"}
+        )
+
+        with tmp_env_var(max_workers_key, "1"):
+            uris = S3StorageBroker.list_dataset_uris(
+                "s3://" + bucket_name,
+                None
+            )
+
+        stubber.assert_no_pending_responses()
+
+    assert uris == [
+        "s3://listing-bucket/uuid-1",
+        "s3://listing-bucket/uuid-2",
+    ]
+
+
+def test_ordered_map_preserves_order():
+
+    import time
+    from dtool_s3.storagebroker import _ordered_map
+
+    def slow_identity(i):
+        time.sleep(0.01 * (5 - i % 5))
+        return i
+
+    results = list(_ordered_map(slow_identity, iter(range(20)), 4))
+    assert results == list(range(20))
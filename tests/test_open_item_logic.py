@@ -0,0 +1,75 @@
+"""Test the file objects reading items using ranged requests."""
+
+import datetime
+import io
+
+from botocore.stub import Stubber
+
+from . import tmp_dir_fixture, tmp_env_var, storage_broker_factory  # NOQA
+
+CONTENT = b"0123456789abcdefghij"
+URI = "s3://open-bucket/ds-uuid"
+
+
+def _add_range_response(stubber, key, start, end):
+    stubber.add_response(
+        "get_object",
+        {"Body": io.BytesIO(CONTENT[start:end + 1])},
+        {
+            "Bucket": "open-bucket",
+            "Key": key,
+            "Range": "bytes={}-{}".format(start, end),
+        }
+    )
+
+
+def test_open_item_reads_only_requested_blocks(
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    from dtoolcore.utils import generate_identifier
+
+    identifier = generate_identifier("big.h5")
+    key = "ds-uuid/data/" + identifier
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", tmp_dir_fixture):
+        storage_broker = storage_broker_factory(URI)
+        with Stubber(storage_broker.s3client) as stubber:
+            stubber.add_response(
+                "head_object",
+                {
+                    "ContentLength": len(CONTENT),
+                    "LastModified": datetime.datetime(2024, 1, 1),
+                    "Metadata": {"handle": "big.h5"},
+                },
+                {"Bucket": "open-bucket", "Key": key}
+            )
+            # Random access reads single blocks.
+            _add_range_response(stubber, key, 12, 15)
+            _add_range_response(stubber, key, 0, 3)
+            # Sequential access reads ahead.
+            _add_range_response(stubber, key, 4, 11)
+            _add_range_response(stubber, key, 16, 19)
+
+            fh = storage_broker.open_item(
+                identifier, block_size=4, cache_blocks=4, read_ahead=1)
+            assert fh.seekable()
+
+            fh.seek(13)
+            assert fh.read(2) == b"de"
+            fh.seek(0)
+            assert fh.read(2) == b"01"
+            # Read from the blocks in memory.
+            fh.seek(-7, io.SEEK_END)
+            assert fh.read(2) == b"de"
+            fh.seek(2)
+            buf = bytearray(12)
+            assert fh.readinto(buf) == 12
+            assert bytes(buf) == CONTENT[2:14]
+            assert fh.tell() == 14
+            assert fh.read() == CONTENT[14:]
+            assert fh.read() == b""
+            fh.close()
+
+            stubber.assert_no_pending_responses()
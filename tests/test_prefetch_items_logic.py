@@ -0,0 +1,116 @@
+"""Test the concurrent prefetching of items into the cache."""
+
+import concurrent.futures
+import threading
+import time
+
+from . import tmp_env_var, storage_broker_factory  # NOQA
+
+URI = "s3://prefetch-bucket/ds-uuid"
+
+
+def _stub_downloads(storage_broker, monkeypatch, get_item_abspath):
+    from dtool_s3.storagebroker import _ItemHead
+    monkeypatch.setattr(
+        storage_broker, "_get_cached_item_fname", lambda identifier: None)
+    monkeypatch.setattr(
+        storage_broker,
+        "_get_item_head",
+        lambda identifier: _ItemHead(
+            size_in_bytes=1, last_modified=None, checksum=None, handle="")
+    )
+    monkeypatch.setattr(storage_broker, "get_item_abspath", get_item_abspath)
+
+
+def test_prefetch_items_yields_results(
+    monkeypatch,
+    storage_broker_factory,  # NOQA
+):
+
+    def get_item_abspath(identifier):
+        if identifier == "bad":
+            raise RuntimeError("download failed")
+        return "/cache/" + identifier
+
+    storage_broker = storage_broker_factory(URI)
+    _stub_downloads(storage_broker, monkeypatch, get_item_abspath)
+    prefetch = storage_broker.prefetch_items(["a", "bad", "b", "a"])
+
+    results = dict(prefetch)
+    # Iterating again yields the same results.
+    assert dict(prefetch) == results
+    assert results["a"] == "/cache/a"
+    assert results["b"] == "/cache/b"
+    assert isinstance(results["bad"], RuntimeError)
+    assert len(results) == 3
+
+
+def test_prefetch_items_priority_and_cancel(
+    monkeypatch,
+    storage_broker_factory,  # NOQA
+):
+
+    started = threading.Event()
+    release = threading.Event()
+    downloaded = []
+
+    def get_item_abspath(identifier):
+        downloaded.append(identifier)
+        if identifier == "a":
+            started.set()
+            release.wait()
+        return "/cache/" + identifier
+
+    storage_broker = storage_broker_factory(URI)
+    _stub_downloads(storage_broker, monkeypatch, get_item_abspath)
+    prefetch = storage_broker.prefetch_items(
+        ["a", "b", "c", "d"], max_workers=1)
+
+    started.wait()
+    # The download of the first item has already started.
+    assert not prefetch.set_priority("a", 10)
+    assert prefetch.set_priority("c", 10)
+    release.set()
+
+    results = iter(prefetch)
+    assert next(results) == ("a", "/cache/a")
+    assert next(results) == ("c", "/cache/c")
+    prefetch.cancel()
+    remaining = dict(results)
+
+    assert downloaded[:2] == ["a", "c"]
+    for identifier in ("b", "d"):
+        if identifier in downloaded:
+            assert remaining[identifier] == "/cache/" + identifier
+        else:
+            assert isinstance(
+                remaining[identifier], concurrent.futures.CancelledError)
+
+
+def test_prefetch_items_ahead_capped_at_cache_budget(
+    monkeypatch,
+    storage_broker_factory,  # NOQA
+):
+
+    downloaded = []
+
+    def get_item_abspath(identifier):
+        downloaded.append(identifier)
+        return "/cache/" + identifier
+
+    with tmp_env_var("DTOOL_S3_CACHE_MAX_BYTES", "2"):
+        storage_broker = storage_broker_factory(URI)
+    _stub_downloads(storage_broker, monkeypatch, get_item_abspath)
+    prefetch = storage_broker.prefetch_items(
+        ["a", "b", "c", "d"], max_workers=4)
+
+    # Items of one byte each, only two of them are downloaded ahead.
+    results = iter(prefetch)
+    deadline = time.monotonic() + 5
+    while len(downloaded) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert len(downloaded) == 2
+
+    assert len(dict(results)) == 4
+    assert sorted(downloaded) == ["a", "b", "c", "d"]
@@ -0,0 +1,86 @@
+"""Test resuming putting items using the local journal."""
+
+import datetime
+import os
+
+import pytest
+from botocore.stub import Stubber
+
+from . import tmp_dir_fixture, tmp_env_var, storage_broker_factory  # NOQA
+
+
+URI = "s3://journal-bucket/ds-uuid"
+
+
+def test_put_item_skips_items_in_journal(
+    monkeypatch,
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    import dtool_s3.storagebroker
+    from dtoolcore.utils import generate_identifier
+
+    fpath = os.path.join(tmp_dir_fixture, "a.txt")
+    with open(fpath, "w") as fh:
+        fh.write("hello")
+    checksum = "5d41402abc4b2a76b9719d911017c592"
+    cache_dir = os.path.join(tmp_dir_fixture, "cache")
+
+    monkeypatch.setattr(
+        dtool_s3.storagebroker,
+        "_put_item_with_retry",
+        lambda **kwargs: {"attempts": 1, "retry_time": 0.0}
+    )
+
+    with tmp_env_var("DTOOL_CACHE_DIRECTORY", cache_dir):
+        storage_broker = storage_broker_factory(URI)
+        storage_broker.put_item(fpath, "a.txt")
+
+        journal_fpath = os.path.join(
+            cache_dir, "dtool-s3-journals", "ds-uuid.jsonl")
+        assert os.path.isfile(journal_fpath)
+
+        # A new process resuming the copy.
+        def fail(**kwargs):
+            raise AssertionError("Item uploaded again")
+
+        monkeypatch.setattr(
+            dtool_s3.storagebroker, "_put_item_with_retry", fail)
+        storage_broker = storage_broker_factory(URI)
+
+        with Stubber(storage_broker.s3client) as stubber:
+            stubber.add_response(
+                "head_object",
+                {
+                    "ContentLength": 5,
+                    "LastModified": datetime.datetime(2024, 1, 1),
+                    "Metadata": {"checksum": checksum},
+                },
+                {
+                    "Bucket": "journal-bucket",
+                    "Key": "ds-uuid/data/" + generate_identifier("a.txt"),
+                }
+            )
+            assert storage_broker.put_item(fpath, "a.txt") == "a.txt"
+            stubber.assert_no_pending_responses()
+
+        # Modified files are put again.
+        with open(fpath, "w") as fh:
+            fh.write("hello world")
+        os.utime(fpath, ns=(0, 0))
+        with pytest.raises(AssertionError):
+            storage_broker.put_item(fpath, "a.txt")
+
+
+def test_read_journal_ignores_incomplete_line(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import _read_journal
+
+    fpath = os.path.join(tmp_dir_fixture, "journal.jsonl")
+    with open(fpath, "w") as fh:
+        fh.write('{"relpath": "a.txt", "size": 1, "mtime_ns": 1, "md5": "x"}\n')  # NOQA
+        fh.write('{"relpath": "b.txt", "si')
+
+    assert list(_read_journal(fpath).keys()) == ["a.txt"]
+    assert _read_journal(os.path.join(tmp_dir_fixture, "missing")) == {}
@@ -15,21 +15,20 @@ def test_get_object_failure():
     Mock scenario where the get fails.
     """
 
-    from botocore.exceptions import WaiterError
+    from botocore.exceptions import ClientError
     from dtool_s3.storagebroker import _object_exists
 
-    mock_s3resource = MagicMock()
-    obj = MagicMock()
-    obj.wait_until_exists = MagicMock(side_effect=WaiterError(
-        'ObjectExists', 'Max attempts exceeded', {}))
-    mock_s3resource.Object = MagicMock(return_value=obj)
+    s3client = MagicMock()
+    s3client.head_object = MagicMock(side_effect=ClientError(
+        {'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject'))
 
     value = _object_exists(
-        mock_s3resource,
+        s3client,
         "dummy_bucket",
         "dummy_dest_path"
     )
 
+    s3client.head_object.assert_called_once()
     assert value is False
 
 
@@ -40,18 +39,43 @@ def test_get_object_success():
 
     from dtool_s3.storagebroker import _object_exists
 
-    mock_s3resource = MagicMock()
-    obj = MagicMock()
-    obj.wait_until_exists = MagicMock()
-    mock_s3resource.Object = MagicMock(return_value=obj)
+    s3client = MagicMock()
+    s3client.head_object = MagicMock()
 
     value = _object_exists(
-        mock_s3resource,
+        s3client,
         "dummy_bucket",
         "dummy_dest_path"
     )
 
-    obj.wait_until_exists.assert_called_once()
+    s3client.head_object.assert_called_once()
+    assert value is True
+
+
+def test_get_object_polls_until_timeout(monkeypatch):
+    """
+    Mock scenario where the object appears while it is being polled.
+    """
+
+    import dtool_s3.storagebroker
+    from botocore.exceptions import ClientError
+    from dtool_s3.storagebroker import _object_exists
+
+    monkeypatch.setattr(dtool_s3.storagebroker.time, "sleep", lambda s: None)
+
+    not_found = ClientError(
+        {'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+    s3client = MagicMock()
+    s3client.head_object = MagicMock(side_effect=[not_found, not_found, {}])
+
+    value = _object_exists(
+        s3client,
+        "dummy_bucket",
+        "dummy_dest_path",
+        timeout=5
+    )
+
+    assert s3client.head_object.call_count == 3
     assert value is True
 
 
@@ -159,11 +183,43 @@ def test_upload_file_simulating_S3UploadFailedError(tmp_dir_fixture):  # NOQA
     assert value is False
 
 
+def test_upload_file_raises_fatal_error():
+    """
+    Mock scenario where upload fails with an error that is not worth retrying.
+    """
+
+    from dtool_s3.storagebroker import _upload_file  # NOQA
+    from boto3.exceptions import S3UploadFailedError
+    from botocore.exceptions import ClientError
+
+    def upload_file(*args, **kwargs):
+        try:
+            raise ClientError(
+                {'Error': {'Code': 'AccessDenied', 'Message': 'Denied'},
+                 'ResponseMetadata': {'HTTPStatusCode': 403}},
+                "PutObject"
+            )
+        except ClientError as e:
+            raise S3UploadFailedError("Failed to upload: " + str(e))
+
+    s3client = MagicMock()
+    s3client.upload_file = upload_file
+
+    with pytest.raises(S3UploadFailedError):
+        _upload_file(
+            s3client,
+            "dummy_fpath",
+            "dummy_bucket",
+            "dummy_dest_path",
+            "dummy_extra_args",
+        )
+
+
 def test_put_item_with_retry():
     from dtool_s3.storagebroker import _put_item_with_retry  # NOQA
 
 
-def test_put_item_with_retry_immediate_success():
+def test_put_item_with_retry_immediate_success(monkeypatch):
     """
     Mock scenario where while doing a put, the upload succeeds without needing
     to retry.
@@ -171,22 +227,27 @@ def test_put_item_with_retry_immediate_success():
 
     import dtool_s3.storagebroker
 
-    dtool_s3.storagebroker._upload_file = MagicMock(return_value=True)
-    dtool_s3.storagebroker._object_exists = MagicMock()
+    upload_file = MagicMock(return_value=True)
+    upload_verified = MagicMock()
+    monkeypatch.setattr(dtool_s3.storagebroker, "_upload_file", upload_file)
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_upload_verified", upload_verified)
 
-    dtool_s3.storagebroker._put_item_with_retry(
+    stats = dtool_s3.storagebroker._put_item_with_retry(
         "dummy_s3client",
-        "dummy_s3resource",
         "dummy_fpath",
         "dummy_bucket",
         "dummy_dest_path",
         {}
     )
-    dtool_s3.storagebroker._upload_file.assert_called()
-    dtool_s3.storagebroker._object_exists.assert_not_called()
+    upload_file.assert_called()
+    upload_verified.assert_not_called()
+    assert stats == {"attempts": 1, "retry_time": 0.0}
 
 
-def test_put_item_with_retry_simulating_upload_error_item_uploaded():
+def test_put_item_with_retry_simulating_upload_error_item_uploaded(
+    monkeypatch
+):
     """
     Mock scenario where while doing a put, the upload fails with an ambiguous
     failure, however item has been successfully created in the bucket.
@@ -194,23 +255,27 @@ def test_put_item_with_retry_simulating_upload_error_item_uploaded():
 
     import dtool_s3.storagebroker
 
-    dtool_s3.storagebroker._upload_file = MagicMock(return_value=False)
-    dtool_s3.storagebroker._object_exists = MagicMock(return_value=True)
+    upload_file = MagicMock(return_value=False)
+    upload_verified = MagicMock(return_value=True)
+    monkeypatch.setattr(dtool_s3.storagebroker, "_upload_file", upload_file)
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_upload_verified", upload_verified)
 
     dtool_s3.storagebroker._put_item_with_retry(
         "dummy_s3client",
-        "dummy_s3resource",
         "dummy_fpath",
         "dummy_bucket",
         "dummy_dest_path",
         {}
     )
 
-    dtool_s3.storagebroker._upload_file.assert_called_once()
-    dtool_s3.storagebroker._object_exists.assert_called_once()
+    upload_file.assert_called_once()
+    upload_verified.assert_called_once()
 
 
-def test_put_item_with_retry_simulating_upload_error_item_doesnt_exist():
+def test_put_item_with_retry_simulating_upload_error_item_doesnt_exist(
+    monkeypatch
+):
     """
     Mock scenario where while doing a put, the upload fails, the object hasn't
     been created on the target, so the retry routine is engaged.
@@ -219,16 +284,18 @@ def test_put_item_with_retry_simulating_upload_error_item_doesnt_exist():
     import dtool_s3.storagebroker
 
     max_retry_time = 10
+    sleep_times = []
 
-    dtool_s3.storagebroker._upload_file = MagicMock(return_value=False)
-    dtool_s3.storagebroker._object_exists = MagicMock(return_value=None)
-    dtool_s3.storagebroker._put_item_with_retry = MagicMock(
-        side_effect=dtool_s3.storagebroker._put_item_with_retry)
+    upload_file = MagicMock(return_value=False)
+    monkeypatch.setattr(dtool_s3.storagebroker, "_upload_file", upload_file)
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_upload_verified", MagicMock(return_value=False))  # NOQA
+    monkeypatch.setattr(
+        dtool_s3.storagebroker.time, "sleep", sleep_times.append)
 
     with pytest.raises(dtool_s3.storagebroker.S3StorageBrokerPutItemError):
         dtool_s3.storagebroker._put_item_with_retry(
             s3client="dummy_s3client",
-            s3resource="dummy_s3resource",
             fpath="dummy_fpath",
             bucket="dummy_bucket",
             dest_path="dummy_dest_path",
@@ -236,7 +303,63 @@ def test_put_item_with_retry_simulating_upload_error_item_doesnt_exist():
             max_retry_time=max_retry_time
         )
 
-    assert dtool_s3.storagebroker._put_item_with_retry.call_count > 1
-    my_args = dtool_s3.storagebroker._put_item_with_retry.call_args
-    args, kwargs = my_args
-    assert kwargs['retry_time_spent'] >= max_retry_time
+    assert upload_file.call_count > 1
+    assert upload_file.call_count == len(sleep_times) + 1
+    # The time spent sleeping stays within the budget.
+    assert sum(sleep_times) <= max_retry_time
+    for attempt, sleep_time in enumerate(sleep_times):
+        assert 0 <= sleep_time <= min(20, 2 ** attempt)
+
+
+def test_put_item_with_retry_recovers(monkeypatch):
+    """
+    Mock scenario where the upload succeeds on the third attempt.
+    """
+
+    import dtool_s3.storagebroker
+
+    upload_file = MagicMock(side_effect=[False, False, True])
+    monkeypatch.setattr(dtool_s3.storagebroker, "_upload_file", upload_file)
+    monkeypatch.setattr(
+        dtool_s3.storagebroker, "_upload_verified", MagicMock(return_value=False))  # NOQA
+    monkeypatch.setattr(dtool_s3.storagebroker.time, "sleep", lambda s: None)
+
+    stats = dtool_s3.storagebroker._put_item_with_retry(
+        "dummy_s3client",
+        "dummy_fpath",
+        "dummy_bucket",
+        "dummy_dest_path",
+        {}
+    )
+
+    assert stats["attempts"] == 3
+    assert 0 <= stats["retry_time"] <= 3
+
+
+def test_upload_verified_compares_checksum():
+
+    from botocore.stub import Stubber
+    from dtool_s3.storagebroker import S3StorageBroker, _upload_verified
+
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("verify-bucket")
+    extra_args = {"Metadata": {"checksum": "abc"}}
+    expected_params = {"Bucket": "verify-bucket", "Key": "key"}
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "head_object", {"Metadata": {"checksum": "abc"}}, expected_params)
+        stubber.add_response(
+            "head_object", {"Metadata": {"checksum": "old"}}, expected_params)
+        stubber.add_client_error(
+            "head_object",
+            service_error_code="404",
+            http_status_code=404,
+            expected_params=expected_params
+        )
+
+        assert _upload_verified(s3client, "verify-bucket", "key", extra_args)
+        assert not _upload_verified(
+            s3client, "verify-bucket", "key", extra_args)
+        assert not _upload_verified(
+            s3client, "verify-bucket", "key", extra_args)
+        stubber.assert_no_pending_responses()
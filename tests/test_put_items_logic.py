@@ -0,0 +1,99 @@
+"""Test putting items concurrently."""
+
+import os
+import threading
+import time
+
+from . import tmp_dir_fixture, storage_broker_factory  # NOQA
+
+
+URI = "s3://put-items-bucket/ds-uuid"
+
+
+def _write_files(directory, sizes):
+    items = []
+    for i, size in enumerate(sizes):
+        fpath = os.path.join(directory, "{}.txt".format(i))
+        with open(fpath, "wb") as fh:
+            fh.write(b"x" * size)
+        items.append((fpath, "{}.txt".format(i)))
+    return items
+
+
+def test_put_items_collects_failures(
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    storage_broker = storage_broker_factory(URI)
+    items = _write_files(tmp_dir_fixture, [1, 2, 3, 4])
+    items.append((os.path.join(tmp_dir_fixture, "missing"), "missing.txt"))
+
+    def put_item(fpath, relpath):
+        if relpath == "2.txt":
+            raise RuntimeError("upload failed")
+        return relpath
+
+    storage_broker.put_item = put_item
+
+    results = dict(storage_broker.put_items(iter(items), max_workers=2))
+
+    assert sorted(results.keys()) == [
+        "0.txt", "1.txt", "2.txt", "3.txt", "missing.txt"]
+    assert results["0.txt"] is None
+    assert isinstance(results["2.txt"], RuntimeError)
+    assert isinstance(results["missing.txt"], OSError)
+
+
+def test_put_items_caps_bytes_in_flight(
+    tmp_dir_fixture,  # NOQA
+    storage_broker_factory,  # NOQA
+):
+
+    storage_broker = storage_broker_factory(URI)
+    items = _write_files(tmp_dir_fixture, [6, 6, 6, 6, 20])
+
+    lock = threading.Lock()
+    in_flight = [0]
+    max_in_flight = [0]
+
+    def put_item(fpath, relpath):
+        size = os.path.getsize(fpath)
+        with lock:
+            in_flight[0] += size
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= size
+        return relpath
+
+    storage_broker.put_item = put_item
+
+    results = list(storage_broker.put_items(
+        items, max_workers=4, max_bytes_in_flight=12))
+
+    assert len(results) == 5
+    # Files larger than the cap are put on their own.
+    assert max_in_flight[0] == 20
+    assert all(error is None for _, error in results)
+
+
+def test_byte_budget_never_exceeded():
+
+    from dtool_s3.storagebroker import _ByteBudget
+
+    budget = _ByteBudget(10)
+    budget.acquire(6)
+
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(6)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.05)
+    budget.release(6)
+    assert acquired.wait(1)
+    thread.join()
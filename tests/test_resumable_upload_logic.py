@@ -0,0 +1,279 @@
+"""Test multipart uploads that can be resumed by another process."""
+
+import base64
+import datetime
+import hashlib
+import json
+import os
+
+from botocore.stub import Stubber
+
+from . import tmp_dir_fixture, storage_broker_factory  # NOQA
+
+
+def _setup(directory):
+    import boto3.s3.transfer
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    _, s3client, _ = S3StorageBroker._get_resource_and_client("resume-bucket")
+    fpath = os.path.join(directory, "item.bin")
+    with open(fpath, "wb") as fh:
+        fh.write(b"0123456789ab")
+    config = boto3.s3.transfer.TransferConfig(
+        multipart_threshold=4,
+        multipart_chunksize=5,
+        max_concurrency=1
+    )
+    state_fpath = os.path.join(directory, "uploads", "id")
+    extra_args = {"Metadata": {"handle": "h", "checksum": "c"}}
+    return s3client, fpath, config, state_fpath, extra_args
+
+
+class _FileBody(object):
+    """Matches file object body of a request with the given content."""
+
+    def __init__(self, content):
+        self._content = content
+
+    def __eq__(self, other):
+        position = other.tell()
+        content = other.read()
+        other.seek(position)
+        return content == self._content
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "_FileBody({!r})".format(self._content)
+
+
+def _part_params(part_number, body):
+    return {
+        "Bucket": "resume-bucket",
+        "Key": "data/id",
+        "UploadId": "upload-1",
+        "PartNumber": part_number,
+        # Parts are streamed from the file rather than read into memory.
+        "Body": _FileBody(body),
+        "ContentMD5": base64.b64encode(hashlib.md5(body).digest()).decode(),
+    }
+
+
+def test_upload_records_parts(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import _upload_file_resumable
+
+    s3client, fpath, config, state_fpath, extra_args = _setup(tmp_dir_fixture)
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "create_multipart_upload",
+            {"UploadId": "upload-1"},
+            {"Bucket": "resume-bucket", "Key": "data/id",
+             "Metadata": {"handle": "h", "checksum": "c"}}
+        )
+        stubber.add_response(
+            "upload_part", {"ETag": '"e1"'}, _part_params(1, b"01234"))
+        stubber.add_client_error(
+            "upload_part",
+            service_error_code="SlowDown",
+            http_status_code=503,
+            expected_params=_part_params(2, b"56789")
+        )
+
+        assert not _upload_file_resumable(
+            s3client,
+            fpath,
+            "resume-bucket",
+            "data/id",
+            extra_args,
+            state_fpath=state_fpath,
+            config=config
+        )
+        stubber.assert_no_pending_responses()
+
+    with open(state_fpath) as fh:
+        assert json.load(fh)["upload_id"] == "upload-1"
+    with open(state_fpath + ".parts") as fh:
+        assert fh.read() == '1 "e1"\n'
+
+
+def test_upload_resumes_missing_parts(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import _upload_file_resumable
+
+    s3client, fpath, config, state_fpath, extra_args = _setup(tmp_dir_fixture)
+
+    stat = os.stat(fpath)
+    os.makedirs(os.path.dirname(state_fpath))
+    with open(state_fpath, "w") as fh:
+        json.dump({
+            "bucket": "resume-bucket",
+            "key": "data/id",
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "checksum": "c",
+            "part_size": 5,
+            "upload_id": "upload-1",
+        }, fh)
+    with open(state_fpath + ".parts", "w") as fh:
+        fh.write('1 "e1"\n')
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "list_parts",
+            {"Parts": [
+                {"PartNumber": 1, "ETag": '"e1"', "Size": 5,
+                 "LastModified": datetime.datetime(2024, 1, 1)},
+                # Part whose upload was interrupted before it was recorded.
+                {"PartNumber": 2, "ETag": '"partial"', "Size": 5,
+                 "LastModified": datetime.datetime(2024, 1, 1)},
+            ]},
+            {"Bucket": "resume-bucket", "Key": "data/id",
+             "UploadId": "upload-1"}
+        )
+        stubber.add_response(
+            "upload_part", {"ETag": '"e2"'}, _part_params(2, b"56789"))
+        stubber.add_response(
+            "upload_part", {"ETag": '"e3"'}, _part_params(3, b"ab"))
+        stubber.add_response(
+            "complete_multipart_upload",
+            {},
+            {
+                "Bucket": "resume-bucket",
+                "Key": "data/id",
+                "UploadId": "upload-1",
+                "MultipartUpload": {"Parts": [
+                    {"PartNumber": 1, "ETag": '"e1"'},
+                    {"PartNumber": 2, "ETag": '"e2"'},
+                    {"PartNumber": 3, "ETag": '"e3"'},
+                ]},
+            }
+        )
+
+        assert _upload_file_resumable(
+            s3client,
+            fpath,
+            "resume-bucket",
+            "data/id",
+            extra_args,
+            state_fpath=state_fpath,
+            config=config
+        )
+        stubber.assert_no_pending_responses()
+
+    # The state is removed once the upload is complete.
+    assert not os.path.exists(state_fpath)
+    assert not os.path.exists(state_fpath + ".parts")
+
+
+def test_abort_stale_multipart_uploads(storage_broker_factory):  # NOQA
+
+    storage_broker = storage_broker_factory("s3://resume-bucket/ds-uuid")
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with Stubber(storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_multipart_uploads",
+            {"Uploads": [
+                {"Key": "ds-uuid/data/old", "UploadId": "u-old",
+                 "Initiated": now - datetime.timedelta(days=2)},
+                {"Key": "ds-uuid/data/new", "UploadId": "u-new",
+                 "Initiated": now},
+            ]},
+            {"Bucket": "resume-bucket", "Prefix": "ds-uuid/data/"}
+        )
+        stubber.add_response(
+            "abort_multipart_upload",
+            {},
+            {"Bucket": "resume-bucket", "Key": "ds-uuid/data/old",
+             "UploadId": "u-old"}
+        )
+        stubber.add_response(
+            "list_multipart_uploads",
+            {},
+            {"Bucket": "resume-bucket", "Prefix": "ds-uuid/staging/"}
+        )
+
+        assert storage_broker.abort_stale_multipart_uploads() == 1
+        stubber.assert_no_pending_responses()
+
+
+def test_upload_without_writable_state(tmp_dir_fixture):  # NOQA
+
+    from dtool_s3.storagebroker import _upload_file_resumable
+
+    s3client, fpath, config, _, extra_args = _setup(tmp_dir_fixture)
+    # The state directory cannot be created below a file.
+    state_fpath = os.path.join(fpath, "uploads", "id")
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "create_multipart_upload",
+            {"UploadId": "upload-1"},
+            {"Bucket": "resume-bucket", "Key": "data/id",
+             "Metadata": {"handle": "h", "checksum": "c"}}
+        )
+        stubber.add_response(
+            "upload_part", {"ETag": '"e1"'}, _part_params(1, b"01234"))
+        stubber.add_response(
+            "upload_part", {"ETag": '"e2"'}, _part_params(2, b"56789"))
+        stubber.add_response(
+            "upload_part", {"ETag": '"e3"'}, _part_params(3, b"ab"))
+        stubber.add_response("complete_multipart_upload", {})
+
+        assert _upload_file_resumable(
+            s3client,
+            fpath,
+            "resume-bucket",
+            "data/id",
+            extra_args,
+            state_fpath=state_fpath,
+            config=config
+        )
+        stubber.assert_no_pending_responses()
+
+
+def test_upload_aborted_on_error_not_worth_retrying(tmp_dir_fixture):  # NOQA
+
+    import pytest
+    from botocore.exceptions import ClientError
+    from dtool_s3.storagebroker import _upload_file_resumable
+
+    s3client, fpath, config, state_fpath, extra_args = _setup(tmp_dir_fixture)
+
+    with Stubber(s3client) as stubber:
+        stubber.add_response(
+            "create_multipart_upload",
+            {"UploadId": "upload-1"},
+            {"Bucket": "resume-bucket", "Key": "data/id",
+             "Metadata": {"handle": "h", "checksum": "c"}}
+        )
+        stubber.add_client_error(
+            "upload_part",
+            service_error_code="AccessDenied",
+            http_status_code=403,
+            expected_params=_part_params(1, b"01234")
+        )
+        # The remaining parts are not uploaded.
+        stubber.add_response(
+            "abort_multipart_upload",
+            {},
+            {"Bucket": "resume-bucket", "Key": "data/id",
+             "UploadId": "upload-1"}
+        )
+
+        with pytest.raises(ClientError):
+            _upload_file_resumable(
+                s3client,
+                fpath,
+                "resume-bucket",
+                "data/id",
+                extra_args,
+                state_fpath=state_fpath,
+                config=config
+            )
+        stubber.assert_no_pending_responses()
+
+    assert not os.path.exists(state_fpath)
@@ -38,6 +38,8 @@ def test_writing_of_dtool_structure_file(tmp_uuid_and_uri):  # NOQA
         "overlays_key_infix": "overlays",
         "annotations_key_infix": "annotations",
         "tags_key_infix": "tags",
+        "handle_index_key_infix": "handle_index",
+        "staging_key_infix": "staging",
         "structure_key_suffix": "structure.json",
         "dtool_readme_key_suffix": "README.txt",
         "dataset_readme_key_suffix": "README.yml",
@@ -0,0 +1,179 @@
+"""Test copying items between S3 datasets server side."""
+
+from botocore.stub import Stubber
+
+from . import storage_broker_factory  # NOQA
+
+
+def test_copy_item_reuses_checksum(storage_broker_factory):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+    from dtool_s3.storagebroker import _unicode_to_base64
+
+    src_storage_broker = storage_broker_factory("s3://copy-src-bucket/ds-uuid")
+    dest_storage_broker = storage_broker_factory(
+        "s3://copy-dest-bucket/ds-uuid", prefix="u/olssont/")
+
+    identifier = generate_identifier("dir/a.txt")
+    properties = {
+        "relpath": "dir/a.txt",
+        "size_in_bytes": 5,
+        "hash": "5d41402abc4b2a76b9719d911017c592",
+        "utc_timestamp": 1.0,
+    }
+
+    with Stubber(dest_storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "copy_object",
+            {},
+            {
+                "CopySource": {
+                    "Bucket": "copy-src-bucket",
+                    "Key": "ds-uuid/data/" + identifier,
+                },
+                "Bucket": "copy-dest-bucket",
+                "Key": "u/olssont/ds-uuid/data/" + identifier,
+                "Metadata": {
+                    "handle": _unicode_to_base64("dir/a.txt"),
+                    "checksum": "5d41402abc4b2a76b9719d911017c592",
+                },
+                "MetadataDirective": "REPLACE",
+            }
+        )
+        relpath = dest_storage_broker.copy_item(
+            src_storage_broker, identifier, properties)
+
+        # The properties of the copied item are known without requests.
+        assert dest_storage_broker.get_hash("dir/a.txt") == properties["hash"]
+        stubber.assert_no_pending_responses()
+
+    assert relpath == "dir/a.txt"
+    assert dest_storage_broker._handle_index_buffer == {identifier: relpath}
+
+
+def test_copy_dataset_falls_back_to_dtoolcore(monkeypatch):
+
+    import dtoolcore
+    import dtool_s3.storagebroker
+    from dtool_s3.storagebroker import copy_dataset
+
+    class FakeDataSet(object):
+        _storage_broker = object()
+
+    monkeypatch.setattr(
+        dtoolcore.DataSet,
+        "from_uri",
+        classmethod(lambda cls, uri, config_path=None: FakeDataSet())
+    )
+    monkeypatch.setattr(
+        dtool_s3.storagebroker.dtoolcore,
+        "copy",
+        lambda *args: "file:///copy"
+    )
+
+    assert copy_dataset("file:///src", "s3://some-bucket") == "file:///copy"
+
+
+def test_copy_dataset_resume_compares_checksums(
+    monkeypatch,
+    storage_broker_factory,  # NOQA
+):
+
+    import datetime
+    import dtoolcore
+    import dtool_s3.storagebroker
+    from dtoolcore.utils import generate_identifier
+    from dtool_s3.storagebroker import (
+        copy_dataset,
+        _unicode_to_base64,
+    )
+
+    src_storage_broker = storage_broker_factory("s3://copy-src-bucket/ds-uuid")
+    dest_storage_broker = storage_broker_factory(
+        "s3://copy-dest-bucket/ds-uuid", max_workers=1)
+
+    id_copied = generate_identifier("copied.txt")
+    id_stale = generate_identifier("stale.txt")
+    items = {
+        id_copied: {"relpath": "copied.txt", "size_in_bytes": 5,
+                    "hash": "checksum-1", "utc_timestamp": 1.0},
+        id_stale: {"relpath": "stale.txt", "size_in_bytes": 5,
+                   "hash": "checksum-2", "utc_timestamp": 1.0},
+    }
+
+    class FakeDataSet(object):
+        name = "ds"
+        uuid = "ds-uuid"
+        _storage_broker = src_storage_broker
+        _manifest = {"items": items}
+        _admin_metadata = {"frozen_at": 1.0}
+
+    class FakeProtoDataSet(object):
+        uri = "s3://copy-dest-bucket/ds-uuid"
+        _storage_broker = dest_storage_broker
+        _admin_metadata = {}
+
+        def freeze(self, progressbar=None):
+            pass
+
+    monkeypatch.setattr(
+        dtoolcore.DataSet,
+        "from_uri",
+        classmethod(lambda cls, uri, config_path=None: FakeDataSet())
+    )
+    monkeypatch.setattr(
+        dtoolcore.ProtoDataSet,
+        "from_uri",
+        classmethod(lambda cls, uri, config_path=None: FakeProtoDataSet())
+    )
+    monkeypatch.setattr(
+        dtool_s3.storagebroker,
+        "_copy_dataset_metadata",
+        lambda src, dest: None
+    )
+
+    with Stubber(dest_storage_broker.s3client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [
+                {"Key": "ds-uuid/data/" + id_copied, "Size": 5},
+                {"Key": "ds-uuid/data/" + id_stale, "Size": 5},
+            ]},
+            {"Bucket": "copy-dest-bucket", "Prefix": "ds-uuid/data/"}
+        )
+        for identifier, checksum in ((id_copied, "checksum-1"),
+                                     (id_stale, "stale")):
+            stubber.add_response(
+                "head_object",
+                {
+                    "ContentLength": 5,
+                    "LastModified": datetime.datetime(2024, 1, 1),
+                    "Metadata": {"checksum": checksum},
+                },
+                {"Bucket": "copy-dest-bucket",
+                 "Key": "ds-uuid/data/" + identifier}
+            )
+        stubber.add_response(
+            "copy_object",
+            {},
+            {
+                "CopySource": {
+                    "Bucket": "copy-src-bucket",
+                    "Key": "ds-uuid/data/" + id_stale,
+                },
+                "Bucket": "copy-dest-bucket",
+                "Key": "ds-uuid/data/" + id_stale,
+                "Metadata": {
+                    "handle": _unicode_to_base64("stale.txt"),
+                    "checksum": "checksum-2",
+                },
+                "MetadataDirective": "REPLACE",
+            }
+        )
+
+        assert copy_dataset(
+            "s3://copy-src-bucket/ds-uuid",
+            "s3://copy-dest-bucket",
+            resume=True
+        ) == "s3://copy-dest-bucket/ds-uuid"
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,33 @@
+"""Test the per bucket configuration of uploads and downloads."""
+
+from . import tmp_env_var
+
+
+def test_transfer_settings_read_from_config():
+
+    from dtool_s3.storagebroker import S3StorageBroker
+
+    bucket_name = "transfer-bucket"
+    with tmp_env_var("DTOOL_S3_MULTIPART_THRESHOLD_" + bucket_name, "67108864"):  # NOQA
+        with tmp_env_var("DTOOL_S3_MAX_CONCURRENCY_" + bucket_name, "32"):
+            storage_broker = S3StorageBroker("s3://" + bucket_name + "/uuid")
+
+    assert storage_broker._transfer_settings == {
+        "multipart_threshold": 64 * 1024 * 1024,
+        "max_concurrency": 32,
+    }
+
+
+def test_transfer_config_adapts_part_size():
+
+    from dtool_s3.storagebroker import _transfer_config, _MIB
+
+    settings = {"multipart_chunksize": 8 * _MIB}
+
+    config = _transfer_config(settings, 1000 * _MIB)
+    assert config.multipart_chunksize == 8 * _MIB
+
+    # 1 TiB would need 131072 parts of 8 MiB.
+    config = _transfer_config(settings, 1024 * 1024 * _MIB)
+    assert config.multipart_chunksize == 105 * _MIB
+    assert config.multipart_chunksize * 10000 >= 1024 * 1024 * _MIB